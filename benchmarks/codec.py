@@ -0,0 +1,142 @@
+"""
+    JSON codec benchmark: the json module vs orjson and msgspec (whichever
+    are installed) on the payloads Kanyus handles most.
+
+    Times decoding an artists/:id/songs page shaped like the real API's
+    (including the typed msgspec decoding get_the_next_page_of_artist_songs( )
+    uses), and encoding / decoding a synthetic mapping the way
+    JsonMappingStore does. Run it from the repo root:
+
+        python benchmarks/codec.py --pages 200 --artists 1000 --songs 100
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, benchmarks_dir)
+
+import main  # noqa: E402
+from startup import build_mapping  # noqa: E402
+
+
+def build_artist_songs_page(artist_id, page, per_page=50):
+    """
+        An artists/:id/songs response with every field Genius sends for a
+        song, most of which Kanyus never reads.
+    """
+    primary_artist = {
+        "api_path": "/artists/" + str(artist_id),
+        "header_image_url": "https://images.genius.com/" + "a" * 32 +
+                            ".1000x333x1.jpg",
+        "id": artist_id, "image_url": "https://images.genius.com/" +
+                                      "b" * 32 + ".1000x1000x1.jpg",
+        "is_meme_verified": False, "is_verified": True,
+        "name": "Artist " + str(artist_id),
+        "url": "https://genius.com/artists/Artist-" + str(artist_id)}
+    songs = []
+    for number in range((page - 1) * per_page, page * per_page):
+        title = "Song " + str(number)
+        slug = "Artist-" + str(artist_id) + "-song-" + str(number)
+        songs.append({
+            "annotation_count": number % 4,
+            "api_path": "/songs/" + str(number),
+            "artist_names": "Artist " + str(artist_id),
+            "full_title": title + " by Artist " + str(artist_id),
+            "header_image_thumbnail_url": "https://images.genius.com/" +
+                                          "c" * 32 + ".300x300x1.jpg",
+            "header_image_url": "https://images.genius.com/" + "c" * 32 +
+                                ".1000x1000x1.jpg",
+            "id": artist_id * 1000000 + number,
+            "lyrics_owner_id": 12345, "lyrics_state": "complete",
+            "path": "/" + slug + "-lyrics", "pyongs_count": number % 7,
+            "relationships_index_url": "https://genius.com/" + slug +
+                                       "-sample",
+            "release_date_components": {"year": 1990 + number % 30,
+                                        "month": number % 12 + 1,
+                                        "day": number % 28 + 1},
+            "release_date_for_display": "March 3, 2001",
+            "release_date_with_abbreviated_month_for_display": "Mar. 3, 2001",
+            "song_art_image_thumbnail_url": "https://images.genius.com/" +
+                                            "d" * 32 + ".300x300x1.jpg",
+            "song_art_image_url": "https://images.genius.com/" + "d" * 32 +
+                                  ".1000x1000x1.jpg",
+            "stats": {"unreviewed_annotations": number % 3,
+                      "hot": number % 50 == 0,
+                      "pageviews": number * 997 % 1000000},
+            "title": title, "title_with_featured": title,
+            "url": "https://genius.com/" + slug + "-lyrics",
+            "featured_artists": [], "primary_artist": primary_artist})
+    return {"meta": {"status": 200},
+            "response": {"songs": songs, "next_page": page + 1}}
+
+
+def time_it(function, runs):
+    started_at = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started_at) / runs
+
+
+def report(name, seconds, baseline):
+    print("%-44s %9.2f ms %7.1fx" % (name, seconds * 1000,
+                                     baseline / seconds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kanyus JSON codec benchmark")
+    parser.add_argument("--pages", type=int, default=200,
+                        help="Times each page decode is repeated.")
+    parser.add_argument("--artists", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Times each mapping encode / decode is repeated.")
+    args = parser.parse_args()
+
+    # The json module goes first, it's the baseline for the speedups.
+    codecs = [main.JSONCodec(name) for name in reversed(main.JSONCodec.names)
+              if name == "json" or main.can_import(name)]
+    page = main.JSONCodec("json").dumps(build_artist_songs_page(860, 1))
+    page = page.encode("utf-8")
+    mapping_data = build_mapping(args.artists, args.songs)
+    print("Page is " + str(len(page) // 1024) + " KB, mapping is " +
+          str(args.artists) + " artists x " + str(args.songs) + " songs")
+
+    baseline = None
+    for codec in codecs:
+        seconds = time_it(lambda: codec.loads(page), args.pages)
+        baseline = baseline or seconds
+        report("artists/:id/songs page, " + codec.name, seconds, baseline)
+    for codec in codecs:
+        if codec.typed_decoding is True:
+            seconds = time_it(lambda: codec.loads_artist_songs_page(page),
+                              args.pages)
+            report("artists/:id/songs page, msgspec typed", seconds, baseline)
+            break
+
+    encoded = {}
+    baseline = None
+    for codec in codecs:
+        main.json_codec = codec
+
+        def encode():
+            f = io.StringIO()
+            main.dump_mapping_json(mapping_data, f)
+            encoded[codec.name] = f.getvalue().encode("utf-8")
+
+        seconds = time_it(encode, args.runs)
+        baseline = baseline or seconds
+        report("mapping encode, " + codec.name, seconds, baseline)
+    baseline = None
+    for codec in codecs:
+        seconds = time_it(lambda: codec.loads(encoded[codec.name]), args.runs)
+        baseline = baseline or seconds
+        report("mapping decode, " + codec.name, seconds, baseline)
+    if any(codec.loads(encoded[codec.name]) != mapping_data
+           for codec in codecs):
+        print("A codec did NOT round trip the mapping!")
+        sys.exit(1)
@@ -0,0 +1,125 @@
+"""
+    End to end crawl benchmark against a local fake Genius API.
+
+    For every scale (songs per artist) it starts benchmarks/fake_genius.py,
+    points a copy of settings.ini at it and times, in a fresh process each:
+
+        --artist      crawling an artist into an empty mapping
+        --artist      crawling it again, merging into the existing mapping
+        --prune       re-checking every song we kept
+
+    and reports wall time, API requests per second and the peak RSS of the
+    main.py process. Run it from the repo root:
+
+        python benchmarks/crawl.py --scales 1000 10000 100000 --latency 0.01
+"""
+import argparse
+import configparser
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, benchmarks_dir)
+
+from fake_genius import FakeGenius  # noqa: E402
+
+
+def write_settings(work_dir, base_url, requests_per_second):
+    """
+        Copies settings.ini into work_dir with BaseURL pointed at the fake
+        server, the response cache off and the rate limit raised.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(repo_dir, "settings.ini"))
+    for section in ("HTTP", "CACHE"):
+        if not config.has_section(section):
+            config.add_section(section)
+    config.set("HTTP", "BaseURL", base_url)
+    config.set("HTTP", "RequestsPerSecond", str(requests_per_second))
+    config.set("HTTP", "BurstSize", str(max(10, int(requests_per_second))))
+    config.set("HTTP", "BackoffFactor", "0.01")
+    config.set("CACHE", "Enabled", "false")
+    with open(os.path.join(work_dir, "settings.ini"), "w") as f:
+        config.write(f)
+
+
+def run_command(command, cwd):
+    """
+        Runs command and returns (wall seconds, peak RSS in KB).
+    """
+    started_at = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - started_at
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(" ".join(command) + " exited with " +
+                           str(process.returncode))
+    peak_rss = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return wall_time, peak_rss
+
+
+def report(name, scale, wall_time, request_count, peak_rss):
+    print("%-28s %8d songs %9.2f s %8d req %9.1f req/s %8.1f MB" %
+          (name, scale, wall_time, request_count, request_count / wall_time,
+           peak_rss / 1024))
+
+
+def benchmark_scale(scale, args):
+    fake_genius = FakeGenius(scale, args.latency, args.throttle_every)
+    base_url = fake_genius.start()
+    work_dir = tempfile.mkdtemp(prefix="kanyus-crawl-")
+    try:
+        write_settings(work_dir, base_url, args.requests_per_second)
+        main_py = os.path.join(repo_dir, "main.py")
+        mapping_filename = os.path.join(work_dir, "mapping." + args.store)
+        if args.store == "json":
+            with open(mapping_filename, "w") as f:
+                json.dump({"artists": [], "songs_to_annotate": {}}, f)
+        base_command = [sys.executable, main_py, "-m", mapping_filename]
+        steps = (("--artist (new mapping)", ["-a", "Artist 16"]),
+                 ("--artist (merge)", ["-a", "Artist 16"]),
+                 ("--prune", ["-p", "Artist 16"]))
+        for name, arguments in steps:
+            request_count = fake_genius.request_count
+            wall_time, peak_rss = run_command(base_command + arguments,
+                                              work_dir)
+            report(name, scale, wall_time,
+                   fake_genius.request_count - request_count, peak_rss)
+    finally:
+        fake_genius.stop()
+        shutil.rmtree(work_dir)
+    return fake_genius.throttled_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kanyus crawl benchmark")
+    parser.add_argument("--scales", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="Songs per artist to benchmark with.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the fake API waits before responding.")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="Answer every Nth request with a 429.")
+    parser.add_argument("--requests-per-second", type=float, default=1000.0,
+                        help="RequestsPerSecond for main.py's rate limiter.")
+    parser.add_argument("--store", choices=("json", "sqlite3"),
+                        default="json", help="Mapping store to benchmark.")
+    args = parser.parse_args()
+
+    print("%-28s %14s %11s %12s %15s %11s" %
+          ("command", "scale", "wall", "requests", "rate", "peak RSS"))
+    for scale in args.scales:
+        throttled_count = benchmark_scale(scale, args)
+        if throttled_count:
+            print("  " + str(throttled_count) + " requests were answered "
+                  "with a 429")
@@ -0,0 +1,252 @@
+"""
+    Local stand-in for the Genius API used by the benchmarks.
+
+    Serves search, artists/:id, artists/:id/songs (paged, sorted by title,
+    release_date or popularity like the real thing), songs/:id,
+    referents?song_id= (paged) and annotations/:id with made up but
+    deterministic data, so crawls can be timed without a token or the
+    network. Artist N is called "Artist N" and has a configurable number of
+    songs. Song N of an artist is released a day after song N - 1, so
+    restarting with more songs looks like the artist released new ones.
+    Stay clear of artist 1, main.py treats an ID of 1 as an error. Every
+    response can be delayed by a fixed latency and every Nth request can be
+    answered with a 429.
+
+    Point settings.ini's [HTTP] BaseURL at it, or run it on its own:
+
+        python benchmarks/fake_genius.py --port 8765 --songs 10000
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGenius:
+    """
+        The fake API server. start( ) serves it from a background thread and
+        returns the base URL to put in settings.ini.
+    """
+
+    def __init__(self, songs_per_artist=1000, latency=0.0, throttle_every=0,
+                 port=0):
+        self.songs_per_artist = songs_per_artist
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.port = port
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.throttled_count = 0
+        self.server = None
+        self.thread = None
+        self.song_orders = {}
+
+    def start(self):
+        fake_genius = self
+
+        class Handler(FakeGeniusHandler):
+            server_state = fake_genius
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self.base_url()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def base_url(self):
+        return "http://127.0.0.1:" + str(self.port) + "/"
+
+    def count_request(self):
+        """
+            Returns True if this request should be answered with a 429.
+        """
+        with self.lock:
+            self.request_count += 1
+            if self.throttle_every and \
+                    self.request_count % self.throttle_every == 0:
+                self.throttled_count += 1
+                return True
+        return False
+
+    def get_song(self, artist_id, song_number):
+        song_id = artist_id * 1000000 + song_number
+        released_on = datetime.date(1990, 1, 1) + \
+            datetime.timedelta(days=song_number)
+        return {"id": song_id,
+                "title": "Song " + str(song_number),
+                "url": "https://genius.com/Artist-" + str(artist_id) +
+                       "-song-" + str(song_number) + "-lyrics",
+                "annotation_count": song_number % 3,
+                "primary_artist": self.get_artist(artist_id),
+                "release_date_components": {
+                    "year": released_on.year, "month": released_on.month,
+                    "day": released_on.day},
+                "stats": {"pageviews": (song_number * 7919) % 100000,
+                          "hot": song_number % 97 == 0}}
+
+    def get_artist(self, artist_id):
+        return {"id": artist_id, "name": "Artist " + str(artist_id),
+                "url": "https://genius.com/artists/Artist-" + str(artist_id)}
+
+    def search(self, query):
+        hits = []
+        artist_ids = [int(word) for word in query.split() if word.isdigit()]
+        for artist_id in artist_ids or [16]:
+            # Like the real thing, hits include songs by other artists.
+            for other_artist_id in (artist_id, artist_id + 1, artist_id + 2):
+                hits.append({"type": "song", "result": self.get_song(
+                    other_artist_id, 0)})
+        return {"hits": hits}
+
+    def get_song_order(self, sort):
+        """
+            Song numbers in the order artists/:id/songs pages through them.
+            Like the real API the default is by title, release_date is
+            newest first and popularity is most viewed first.
+        """
+        if sort not in self.song_orders:
+            song_numbers = range(self.songs_per_artist)
+            if sort == "release_date":
+                order = sorted(song_numbers, reverse=True)
+            elif sort == "popularity":
+                order = sorted(song_numbers,
+                               key=lambda number: -((number * 7919) % 100000))
+            else:
+                order = sorted(song_numbers,
+                               key=lambda number: "Song " + str(number))
+            self.song_orders[sort] = order
+        return self.song_orders[sort]
+
+    def artist_songs(self, artist_id, query):
+        page = int(query.get("page", ["1"])[0])
+        per_page = min(int(query.get("per_page", ["20"])[0]), 50)
+        sort = query.get("sort", ["title"])[0]
+        if sort not in ("title", "release_date", "popularity"):
+            return None
+        first = (page - 1) * per_page
+        last = min(self.songs_per_artist, first + per_page)
+        songs = [self.get_song(artist_id, song_number)
+                 for song_number in self.get_song_order(sort)[first:last]]
+        next_page = page + 1 if last < self.songs_per_artist else None
+        return {"songs": songs, "next_page": next_page}
+
+    def song(self, song_id):
+        artist_id, song_number = divmod(song_id, 1000000)
+        if artist_id == 0 or song_number >= self.songs_per_artist:
+            return None
+        song = self.get_song(artist_id, song_number)
+        # Pretend half of the songs got annotated since the crawl.
+        song["annotation_count"] += song_id % 2
+        return {"song": song}
+
+    def referents(self, query):
+        song_id = int(query["song_id"][0])
+        page = int(query.get("page", ["1"])[0])
+        per_page = min(int(query.get("per_page", ["20"])[0]), 50)
+        referent_count = (song_id % 7) * 20
+        first = (page - 1) * per_page
+        referents = []
+        for number in range(first, min(referent_count, first + per_page)):
+            referent_id = song_id * 1000 + number
+            referents.append({
+                "id": referent_id, "song_id": song_id,
+                "fragment": "Fragment " + str(number) + " of the lyrics",
+                "annotations": [{"id": referent_id,
+                                 "verified": number % 4 == 0,
+                                 "votes_total": number,
+                                 "body": {"plain": "Fake annotation"}}]})
+        return {"referents": referents}
+
+    def annotation(self, annotation_id):
+        return {"annotation": {"id": annotation_id, "votes_total": 0,
+                               "body": {"plain": "Fake annotation"}}}
+
+    def route(self, path, query):
+        """
+            Returns the response body for path or None for a 404.
+        """
+        parts = path.strip("/").split("/")
+        try:
+            if parts == ["search"]:
+                return self.search(query.get("q", [""])[0])
+            if len(parts) == 3 and parts[0] == "artists" and \
+                    parts[2] == "songs":
+                return self.artist_songs(int(parts[1]), query)
+            if len(parts) == 2 and parts[0] == "artists":
+                return {"artist": self.get_artist(int(parts[1]))}
+            if len(parts) == 2 and parts[0] == "songs":
+                return self.song(int(parts[1]))
+            if parts == ["referents"]:
+                return self.referents(query)
+            if len(parts) == 2 and parts[0] == "annotations":
+                return self.annotation(int(parts[1]))
+        except (KeyError, ValueError):
+            pass
+        return None
+
+
+class FakeGeniusHandler(BaseHTTPRequestHandler):
+    server_state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake_genius = self.server_state
+        if fake_genius.latency:
+            time.sleep(fake_genius.latency)
+        if fake_genius.count_request():
+            self.send_json(429, {"meta": {"status": 429,
+                                          "message": "Too many requests"}},
+                           {"Retry-After": "0"})
+            return
+        url = urllib.parse.urlsplit(self.path)
+        response = fake_genius.route(url.path,
+                                     urllib.parse.parse_qs(url.query))
+        if response is None:
+            self.send_json(404, {"meta": {"status": 404,
+                                          "message": "Not found"}})
+            return
+        self.send_json(200, {"meta": {"status": 200}, "response": response})
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Genius API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--songs", type=int, default=1000,
+                        help="Songs per artist.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds to wait before every response.")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="Answer every Nth request with a 429.")
+    args = parser.parse_args()
+
+    fake_genius = FakeGenius(args.songs, args.latency, args.throttle_every,
+                             args.port)
+    print("Serving a fake Genius API at " + fake_genius.start())
+    try:
+        fake_genius.thread.join()
+    except KeyboardInterrupt:
+        fake_genius.stop()
@@ -0,0 +1,79 @@
+"""
+    Memory benchmark for loaded mappings: the plain dicts
+    read_artist_song_mapping_file( ) returns vs CompactMapping.
+
+    Builds a synthetic JSON mapping in a temp directory, loads it both ways
+    and reports the memory each copy keeps alive (measured with tracemalloc)
+    and how long loading took. It also checks the compact copy converts back
+    to exactly the mapping it was built from. Run it from the repo root:
+
+        python benchmarks/memory.py --artists 1000 --songs 100
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, benchmarks_dir)
+
+import main  # noqa: E402
+from startup import build_mapping  # noqa: E402
+
+
+def measure(load):
+    """
+        Returns (what load( ) returned, MB it keeps alive, peak MB while
+        loading, seconds).
+    """
+    gc.collect()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    mapping = load()
+    seconds = time.perf_counter() - started_at
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mapping, current / 1024 / 1024, peak / 1024 / 1024, seconds
+
+
+def report(name, retained, peak, seconds):
+    print("%-28s %9.1f MB kept %9.1f MB peak %8.2f s" %
+          (name, retained, peak, seconds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kanyus memory benchmark")
+    parser.add_argument("--artists", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=100)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="kanyus-memory-")
+    try:
+        filename = os.path.join(work_dir, "mapping.json")
+        with open(filename, "w") as f:
+            main.dump_mapping_json(build_mapping(args.artists, args.songs), f)
+        print("Mapping: " + str(args.artists) + " artists x " +
+              str(args.songs) + " songs, JSON is " +
+              str(os.path.getsize(filename) // 1024) + " KB")
+
+        mapping_data, retained, peak, seconds = measure(
+            lambda: main.read_artist_song_mapping_file(filename))
+        report("dicts (MappingData)", retained, peak, seconds)
+        compact_mapping, retained, peak, seconds = measure(
+            lambda: main.read_artist_song_mapping_file(filename,
+                                                       compact=True))
+        report("CompactMapping", retained, peak, seconds)
+
+        if compact_mapping.to_mapping_data() != mapping_data:
+            print("CompactMapping did NOT round trip to the same mapping!")
+            sys.exit(1)
+        print("CompactMapping round trips to the same mapping.")
+    finally:
+        shutil.rmtree(work_dir)
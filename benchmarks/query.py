@@ -0,0 +1,152 @@
+"""
+    Query benchmark for --query: how long building the SongQueryIndex takes
+    and how fast queries over the whole mapping are once it's built.
+
+    Builds a synthetic mapping (titles made from a small vocabulary, spread
+    out date_added and annotation counts), times a few typical queries and
+    checks every one against a plain scan of the mapping. It also times
+    adding songs through add_to_songs_mapping( ), which keeps the index up
+    to date as it goes. Run it from the repo root:
+
+        python benchmarks/query.py --artists 1000 --songs 100
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, benchmarks_dir)
+
+import main  # noqa: E402
+from startup import build_mapping  # noqa: E402
+
+words = ("love", "night", "city", "fire", "dream", "money", "heart", "rain",
+         "gold", "ghost", "summer", "river", "crown", "echo", "velvet", "road")
+
+
+def build_query_mapping(artist_count, songs_per_artist):
+    mapping_data = main.MappingData(build_mapping(artist_count,
+                                                  songs_per_artist))
+    first_day = datetime.date(2020, 1, 1)
+    for artist_songs in mapping_data["songs_to_annotate"].values():
+        for song in artist_songs:
+            song_id = song["song_id"]
+            song["song_name"] = " ".join(
+                words[song_id // 7 ** n % len(words)] for n in range(3)) + \
+                " " + str(song_id % 1000)
+            song["song_note_amt"] = song_id % 13
+            song["date_added"] = (first_day + datetime.timedelta(
+                days=song_id % 1500)).isoformat()
+    return mapping_data
+
+
+def scan(mapping_data, text=None, substring=None, artist_name=None,
+         min_annotation_count=None, max_annotation_count=None,
+         added_since=None, added_until=None):
+    """
+        The song IDs query_songs( ) should find, the slow way.
+    """
+    artist_key = None
+    if artist_name is not None:
+        artist_key = str(main.search_mapping_for_artist_id(artist_name,
+                                                           mapping_data))
+    song_ids = set()
+    for key, artist_songs in mapping_data["songs_to_annotate"].items():
+        if artist_key is not None and key != artist_key:
+            continue
+        for song in artist_songs:
+            title = main.SongQueryIndex.normalize_title(song["song_name"])
+            if text is not None and not set(text.split()) <= \
+                    set(title.split()):
+                continue
+            if substring is not None and substring not in title:
+                continue
+            if min_annotation_count is not None and \
+                    song["song_note_amt"] < min_annotation_count:
+                continue
+            if max_annotation_count is not None and \
+                    song["song_note_amt"] > max_annotation_count:
+                continue
+            if added_since is not None and song["date_added"] < added_since:
+                continue
+            if added_until is not None and song["date_added"] > added_until:
+                continue
+            song_ids.add(song["song_id"])
+    return song_ids
+
+
+def time_it(function, runs):
+    started_at = time.perf_counter()
+    for _ in range(runs):
+        result = function()
+    return result, (time.perf_counter() - started_at) / runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kanyus query benchmark")
+    parser.add_argument("--artists", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=20,
+                        help="Times each query is repeated.")
+    args = parser.parse_args()
+
+    mapping_data = build_query_mapping(args.artists, args.songs)
+    print("Mapping: " + str(args.artists) + " artists x " + str(args.songs) +
+          " songs")
+    _, seconds = time_it(lambda: main.get_query_index(mapping_data), 1)
+    print("%-52s %9.2f ms" % ("building the index", seconds * 1000))
+
+    # build_mapping( ) names its artists "Artist 1" .. "Artist N" after
+    # their IDs, and artist ID 1 looks like an error, so skip that one.
+    artist_name = "Artist " + str(max(2, args.artists // 2))
+    queries = [
+        ("words: love night", {"text": "love night"}),
+        ("words: fire, 5+ annotations", {"text": "fire",
+                                         "min_annotation_count": 5}),
+        ("substring: ver", {"substring": "ver"}),
+        ("substring: elvet gh", {"substring": "elvet gh"}),
+        ("artist: " + artist_name, {"artist_name": artist_name}),
+        ("added in 2021, 0-2 annotations", {
+            "added_since": "2021-01-01", "added_until": "2021-12-31",
+            "max_annotation_count": 2}),
+        ("everything, newest first", {}),
+    ]
+    if args.artists < 2:
+        queries.pop(4)
+    for name, query in queries:
+        (total, rows), seconds = time_it(
+            lambda: main.query_songs(mapping_data, sort_by="date_added",
+                                     descending=True, limit=50, **query),
+            args.runs)
+        print("%-52s %9.2f ms %8d songs" % (name, seconds * 1000, total))
+        if total != len(scan(mapping_data, **query)):
+            print("query_songs( ) did NOT find the same songs as a scan!")
+            sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix="kanyus-query-")
+    try:
+        filename = os.path.join(work_dir, "mapping.json")
+        with open(filename, "w") as f:
+            main.dump_mapping_json(mapping_data, f)
+        new_songs = [{"song_name": "brand new ghost " + str(number),
+                      "song_id": 999000000 + number, "song_note_amt": 1,
+                      "song_url": "https://genius.com/new-" + str(number) +
+                                  "-lyrics"} for number in range(1000)]
+        _, seconds = time_it(lambda: main.add_to_songs_mapping(
+            16, new_songs, mapping_data, filename), 1)
+        (total, rows), query_seconds = time_it(
+            lambda: main.query_songs(mapping_data, "brand new"), args.runs)
+        print("%-52s %9.2f ms" % ("adding 1000 songs", seconds * 1000))
+        print("%-52s %9.2f ms %8d songs" % ("words: brand new (after adding)",
+                                            query_seconds * 1000, total))
+        if total != len(new_songs):
+            print("The index did NOT pick up the added songs!")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,94 @@
+"""
+    Startup time benchmark for local (no network) Kanyus commands.
+
+    Builds a synthetic mapping in a temp directory, then times
+    `main.py --listsongsby` and `main.py --erasefrommapping` end to end, plus
+    a bare `import main`. Run it from the repo root:
+
+        python benchmarks/startup.py --artists 2000 --songs 50 --runs 10
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import main  # noqa: E402
+
+
+def build_mapping(artist_count, songs_per_artist):
+    mapping_data = {"artists": [], "songs_to_annotate": {}}
+    for artist_id in range(1, artist_count + 1):
+        mapping_data["artists"].append({"names": ["Artist " + str(artist_id)],
+                                        "ID": artist_id})
+        mapping_data["songs_to_annotate"][str(artist_id)] = [
+            {"song_name": "Song " + str(song_number),
+             "song_id": artist_id * 100000 + song_number,
+             "song_note_amt": 0,
+             "song_url": "https://genius.com/Artist-" + str(artist_id) +
+                         "-song-" + str(song_number) + "-lyrics"}
+            for song_number in range(songs_per_artist)]
+    return mapping_data
+
+
+def time_command(command, cwd, runs):
+    timings = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started_at)
+    return timings
+
+
+def report(name, timings):
+    print("%-40s median %7.1f ms   min %7.1f ms" %
+          (name, statistics.median(timings) * 1000, min(timings) * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kanyus startup benchmark")
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="kanyus-startup-")
+    try:
+        shutil.copy(os.path.join(repo_dir, "settings.ini"), work_dir)
+        mapping_data = build_mapping(args.artists, args.songs)
+        json_filename = os.path.join(work_dir, "mapping.json")
+        with open(json_filename, "w") as f:
+            main.dump_mapping_json(mapping_data, f)
+        sqlite_filename = os.path.join(work_dir, "mapping.sqlite3")
+        main.SqliteMappingStore(sqlite_filename).save(mapping_data)
+        print("Mapping: " + str(args.artists) + " artists x " +
+              str(args.songs) + " songs, JSON is " +
+              str(os.path.getsize(json_filename) // 1024) + " KB")
+
+        python = sys.executable
+        main_py = os.path.join(repo_dir, "main.py")
+        artist_name = "Artist " + str(args.artists // 2)
+        report("python -c pass (interpreter)", time_command(
+            [python, "-c", "pass"], repo_dir, args.runs))
+        report("import main", time_command(
+            [python, "-c", "import main"], repo_dir, args.runs))
+        report("main.py --help", time_command(
+            [python, main_py, "--help"], work_dir, args.runs))
+        for label, filename in (("json", json_filename),
+                                ("sqlite", sqlite_filename)):
+            report("--listsongsby (" + label + ")", time_command(
+                [python, main_py, "-m", filename, "-l", artist_name],
+                work_dir, args.runs))
+        # Erasing appends to the journal, so run it last and only once.
+        report("--erasefrommapping (json)", time_command(
+            [python, main_py, "-m", json_filename, "-e", artist_name],
+            work_dir, 1))
+    finally:
+        shutil.rmtree(work_dir)
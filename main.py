@@ -1,73 +1,2621 @@
 import argparse
+import array
+import atexit
+import bisect
+import collections
+import concurrent.futures
 import configparser
+import contextlib
+import csv
+import datetime
+import difflib
+import email.utils
+import heapq
 import json
 import logging
-import requests
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import sqlite3
+import struct
 import sys
+import threading
+import time
+import unicodedata
+import urllib.parse
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# requests, asyncio and the JSON codec are imported when they're first
+# needed so local commands like --listsongsby start quickly.
+json_codec = None
+
+logger = logging.getLogger('main_thread_logger')
 
 # Genius API Token / API endpoint setup
 config = configparser.ConfigParser()
 config.read('settings.ini')
-api_token = config["API_KEYS"]["GeniusAPI"]
-base_url = "https://api.genius.com/"
+api_token = None
+# BaseURL can point at a local stand-in server, see benchmarks/fake_genius.py
+base_url = config.get("HTTP", "BaseURL", fallback="https://api.genius.com/")
+
+# Crawler setup. The Genius API caps per_page at 50.
+page_workers = config.getint("CRAWLER", "PageWorkers", fallback=4)
+songs_per_page = config.getint("CRAWLER", "SongsPerPage", fallback=50)
+prune_workers = config.getint("CRAWLER", "PruneWorkers", fallback=8)
+artist_workers = config.getint("CRAWLER", "ArtistWorkers", fallback=4)
+full_crawl_interval = config.getfloat("CRAWLER", "FullCrawlDays",
+                                      fallback=7) * 24 * 3600
+# IncrementalSort has to page newest release first, see
+# iter_artist_songs_to_annotate( ).
+incremental_sort = config.get("CRAWLER", "IncrementalSort",
+                              fallback="release_date")
+incremental_stop_pages = config.getint("CRAWLER", "IncrementalStopPages",
+                                       fallback=1)
+# Artist ID lookups page through at most SearchMaxPages of /search hits and
+# fall back to fuzzy name matching at ArtistMatchCutoff (0..1) similarity.
+search_max_pages = config.getint("CRAWLER", "SearchMaxPages", fallback=3)
+artist_match_cutoff = config.getfloat("CRAWLER", "ArtistMatchCutoff",
+                                      fallback=0.85)
+# A fuzzy match has to beat the next closest name by ArtistMatchMargin and is
+# only used with --accept-fuzzy.
+artist_match_margin = config.getfloat("CRAWLER", "ArtistMatchMargin",
+                                      fallback=0.05)
+accept_fuzzy_matches = False
+# --coverage checks CoverageWorkers songs' referents at a time and skips
+# songs whose coverage was checked less than CoverageDays ago.
+coverage_workers = config.getint("CRAWLER", "CoverageWorkers", fallback=8)
+coverage_interval = config.getfloat("CRAWLER", "CoverageDays",
+                                    fallback=7) * 24 * 3600
+referents_per_page = 50
+
+# --serve setup. The daemon keeps to RequestsPerMinute API calls, refreshes
+# each artist about every RefreshHours (sooner the more its songs churned
+# last time) and re-checks at most PruneBatch of its songs per refresh.
+serve_requests_per_minute = config.getfloat("SERVE", "RequestsPerMinute",
+                                            fallback=60)
+serve_refresh_interval = config.getfloat("SERVE", "RefreshHours",
+                                         fallback=24) * 3600
+serve_prune_batch = config.getint("SERVE", "PruneBatch", fallback=200)
+serve_churn_weight = config.getfloat("SERVE", "ChurnWeight", fallback=10)
+# With --stats-json / --stats-prom the daemon rewrites them every StatsSeconds.
+serve_stats_interval = config.getfloat("SERVE", "StatsSeconds", fallback=60)
+serve_retry_interval = 15 * 60
+
+# HTTP client setup. Every Genius API call shares one session and limiter.
+pool_size = config.getint("HTTP", "PoolSize", fallback=10)
+requests_per_second = config.getfloat("HTTP", "RequestsPerSecond",
+                                      fallback=5.0)
+burst_size = config.getint("HTTP", "BurstSize", fallback=10)
+max_retries = config.getint("HTTP", "MaxRetries", fallback=5)
+backoff_factor = config.getfloat("HTTP", "BackoffFactor", fallback=0.5)
+retry_status_codes = (429, 500, 502, 503, 504)
+
+# Song scoring setup. Songs with min_annotations..max_annotations annotations
+# are kept. With --top N only the N best scoring songs are kept, where the
+# score rewards pageviews, "hot" songs and recent releases and penalizes
+# existing annotations.
+min_annotations = config.getint("SCORING", "MinAnnotations", fallback=0)
+max_annotations = config.getint("SCORING", "MaxAnnotations", fallback=0)
+top_songs_count = None
+score_weights = {
+    "annotations": config.getfloat("SCORING", "AnnotationWeight",
+                                   fallback=1.0),
+    "pageviews": config.getfloat("SCORING", "PageviewsWeight", fallback=1.0),
+    "hot": config.getfloat("SCORING", "HotWeight", fallback=2.0),
+    "recency": config.getfloat("SCORING", "RecencyWeight", fallback=2.0),
+}
+
+# JSON codec setup. "auto" uses orjson or msgspec when one is installed and
+# the json module otherwise. See get_json_codec( ).
+json_codec_name = config.get("JSON", "Codec", fallback="auto")
+
+# Mapping setup. Filenames ending in one of sqlite_extensions use the SQLite
+# mapping store, everything else is a JSON file.
+default_mapping_filename = "artist_song_id_mapping.json"
+sqlite_extensions = (".db", ".sqlite", ".sqlite3")
+journal_max_bytes = config.getint("MAPPING", "JournalMaxKB",
+                                  fallback=4096) * 1024
+snapshot_row_group_size = config.getint("MAPPING", "SnapshotRowGroupSize",
+                                        fallback=65536)
+snapshot_compression_level = config.getint(
+    "MAPPING", "SnapshotCompressionLevel", fallback=6)
+
+# Response cache setup. TTLs are in seconds and 0 turns caching off for that
+# endpoint. annotation_count changes often so song data is short lived.
+cache_enabled = config.getboolean("CACHE", "Enabled", fallback=True)
+cache_filename = config.get("CACHE", "Path", fallback="genius_cache.sqlite3")
+cache_max_bytes = config.getint("CACHE", "MaxSizeMB", fallback=256) * 1024 * \
+    1024
+cache_ttls = {
+    "search": config.getint("CACHE", "SearchTTL", fallback=7 * 24 * 3600),
+    "artists": config.getint("CACHE", "ArtistTTL", fallback=24 * 3600),
+    "artist_songs": config.getint("CACHE", "ArtistSongsTTL", fallback=3600),
+    "songs": config.getint("CACHE", "SongTTL", fallback=3600),
+    "annotations": config.getint("CACHE", "AnnotationTTL", fallback=3600),
+    "referents": config.getint("CACHE", "ReferentTTL", fallback=3600),
+}
+
+
+class Metrics:
+    """
+        Collects run statistics: per endpoint Genius API calls (latency,
+        status codes, retries, bytes received and cache results) and time
+        spent in named stages like mapping_load or filtering.
+
+        Latencies are kept as a histogram: a count per latency_buckets
+        bucket (the last one is +Inf) plus their sum, count and max, so a
+        long --serve run uses the same memory as a short one.
+
+        summary( ) feeds --stats and --stats-json, and
+        write_prometheus_textfile( ) feeds --stats-prom. --workers processes
+        send what they recorded back with take_counts( ) and the parent
+        adds it in with merge_counts( ).
+    """
+
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                       5.0, 10.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.reset()
+
+    def reset(self):
+        self.latency_counts = collections.defaultdict(
+            lambda: [0] * (len(self.latency_buckets) + 1))
+        self.latency_sums = collections.Counter()
+        self.latency_maxes = collections.Counter()
+        self.status_codes = collections.defaultdict(collections.Counter)
+        self.retries = collections.Counter()
+        self.bytes_received = collections.Counter()
+        self.cache_events = collections.defaultdict(collections.Counter)
+        self.stage_seconds = collections.Counter()
+        self.stage_calls = collections.Counter()
+
+    def record_request(self, endpoint, status, seconds, size):
+        with self.lock:
+            self.latency_counts[endpoint][
+                bisect.bisect_left(self.latency_buckets, seconds)] += 1
+            self.latency_sums[endpoint] += seconds
+            self.latency_maxes[endpoint] = max(self.latency_maxes[endpoint],
+                                               seconds)
+            self.status_codes[endpoint][str(status)] += 1
+            self.bytes_received[endpoint] += size
+
+    def record_retry(self, endpoint):
+        with self.lock:
+            self.retries[endpoint] += 1
+
+    def record_cache(self, endpoint, result):
+        with self.lock:
+            self.cache_events[endpoint][result] += 1
+
+    def record_stage(self, stage, seconds):
+        with self.lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+
+    def take_counts(self):
+        """
+            Returns everything recorded so far as plain dicts, which pickle,
+            and starts counting from zero again.
+        """
+        with self.lock:
+            counts = {
+                "latency_counts": dict(self.latency_counts),
+                "latency_sums": dict(self.latency_sums),
+                "latency_maxes": dict(self.latency_maxes),
+                "status_codes": {endpoint: dict(statuses) for endpoint,
+                                 statuses in self.status_codes.items()},
+                "retries": dict(self.retries),
+                "bytes_received": dict(self.bytes_received),
+                "cache_events": {endpoint: dict(events) for endpoint, events
+                                 in self.cache_events.items()},
+                "stage_seconds": dict(self.stage_seconds),
+                "stage_calls": dict(self.stage_calls)}
+            self.reset()
+        return counts
+
+    def merge_counts(self, counts):
+        """
+            Adds counts from another process' take_counts( ) to ours.
+        """
+        with self.lock:
+            for endpoint, bucket_counts in counts["latency_counts"].items():
+                latency_counts = self.latency_counts[endpoint]
+                for index, count in enumerate(bucket_counts):
+                    latency_counts[index] += count
+            self.latency_sums.update(counts["latency_sums"])
+            for endpoint, seconds in counts["latency_maxes"].items():
+                self.latency_maxes[endpoint] = max(
+                    self.latency_maxes[endpoint], seconds)
+            for endpoint, statuses in counts["status_codes"].items():
+                self.status_codes[endpoint].update(statuses)
+            self.retries.update(counts["retries"])
+            self.bytes_received.update(counts["bytes_received"])
+            for endpoint, events in counts["cache_events"].items():
+                self.cache_events[endpoint].update(events)
+            self.stage_seconds.update(counts["stage_seconds"])
+            self.stage_calls.update(counts["stage_calls"])
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started_at)
+
+    def summary(self):
+        with self.lock:
+            endpoints = {}
+            for endpoint in sorted(set(self.latency_counts) |
+                                   set(self.cache_events)):
+                counts = self.latency_counts.get(
+                    endpoint, [0] * (len(self.latency_buckets) + 1))
+                requests_made = sum(counts)
+                max_latency = self.latency_maxes[endpoint]
+                elapsed = max(time.time() - self.started_at, 1e-9)
+                endpoints[endpoint] = {
+                    "requests": requests_made,
+                    "requests_per_second": requests_made / elapsed,
+                    "status_codes": dict(self.status_codes[endpoint]),
+                    "retries": self.retries[endpoint],
+                    "bytes_received": self.bytes_received[endpoint],
+                    "cache": dict(self.cache_events[endpoint]),
+                    "latency_seconds": {
+                        "mean": self.latency_sums[endpoint] / requests_made
+                        if requests_made else 0.0,
+                        "p50": get_histogram_percentile(
+                            self.latency_buckets, counts, 50, max_latency),
+                        "p95": get_histogram_percentile(
+                            self.latency_buckets, counts, 95, max_latency),
+                        "max": max_latency,
+                    },
+                }
+            stages = {stage: {"seconds": self.stage_seconds[stage],
+                              "calls": self.stage_calls[stage]}
+                      for stage in sorted(self.stage_seconds)}
+        return {"started_at": self.started_at,
+                "wall_seconds": time.time() - self.started_at,
+                "endpoints": endpoints, "stages": stages}
+
+    def write_prometheus_textfile(self, filename):
+        """
+            Writes the metrics in the Prometheus text format, atomically so
+            the node_exporter textfile collector never sees half a file.
+        """
+        lines = []
+        with self.lock:
+            lines.append("# TYPE kanyus_api_requests_total counter")
+            for endpoint, statuses in sorted(self.status_codes.items()):
+                for status, count in sorted(statuses.items()):
+                    lines.append('kanyus_api_requests_total{endpoint="' +
+                                 endpoint + '",status="' + status + '"} ' +
+                                 str(count))
+            lines.append("# TYPE kanyus_api_request_duration_seconds "
+                         "histogram")
+            for endpoint, counts in sorted(self.latency_counts.items()):
+                labels = 'endpoint="' + endpoint + '"'
+                count = 0
+                for bucket, bucket_count in zip(self.latency_buckets,
+                                                counts):
+                    count += bucket_count
+                    lines.append("kanyus_api_request_duration_seconds_bucket"
+                                 "{" + labels + ',le="' + str(bucket) +
+                                 '"} ' + str(count))
+                lines.append("kanyus_api_request_duration_seconds_bucket{" +
+                             labels + ',le="+Inf"} ' + str(sum(counts)))
+                lines.append("kanyus_api_request_duration_seconds_sum{" +
+                             labels + "} " +
+                             repr(self.latency_sums[endpoint]))
+                lines.append("kanyus_api_request_duration_seconds_count{" +
+                             labels + "} " + str(sum(counts)))
+            lines.append("# TYPE kanyus_api_retries_total counter")
+            for endpoint, count in sorted(self.retries.items()):
+                lines.append('kanyus_api_retries_total{endpoint="' +
+                             endpoint + '"} ' + str(count))
+            lines.append("# TYPE kanyus_api_response_bytes_total counter")
+            for endpoint, count in sorted(self.bytes_received.items()):
+                lines.append('kanyus_api_response_bytes_total{endpoint="' +
+                             endpoint + '"} ' + str(count))
+            lines.append("# TYPE kanyus_api_cache_events_total counter")
+            for endpoint, events in sorted(self.cache_events.items()):
+                for result, count in sorted(events.items()):
+                    lines.append('kanyus_api_cache_events_total{endpoint="' +
+                                 endpoint + '",result="' + result + '"} ' +
+                                 str(count))
+            lines.append("# TYPE kanyus_stage_seconds_total counter")
+            for stage, seconds in sorted(self.stage_seconds.items()):
+                lines.append('kanyus_stage_seconds_total{stage="' + stage +
+                             '"} ' + repr(seconds))
+            lines.append("# TYPE kanyus_stage_calls_total counter")
+            for stage, count in sorted(self.stage_calls.items()):
+                lines.append('kanyus_stage_calls_total{stage="' + stage +
+                             '"} ' + str(count))
+            lines.append("# TYPE kanyus_last_run_timestamp_seconds gauge")
+            lines.append("kanyus_last_run_timestamp_seconds " +
+                         repr(self.started_at))
+        temp_filename = filename + "." + str(os.getpid()) + ".tmp"
+        with open(temp_filename, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_filename, filename)
+
+
+def get_histogram_percentile(buckets, counts, percentile, max_value):
+    """
+        Utils function: Estimates a percentile from histogram bucket counts
+        (counts has one more entry than buckets, for +Inf) by interpolating
+        inside the bucket it falls in, like Prometheus' histogram_quantile.
+        Never more than max_value, the largest value we saw.
+    """
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = percentile / 100.0 * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count > 0 and seen + count >= rank:
+            lower = buckets[index - 1] if index > 0 else 0.0
+            upper = buckets[index] if index < len(buckets) else max_value
+            return min(max_value, lower + (upper - lower) *
+                       (rank - seen) / count)
+        seen += count
+    return max_value
+
+
+metrics = Metrics()
+
+
+class TokenBucket:
+    """
+        Thread safe token bucket. acquire( ) blocks until a token is
+        available so every thread sharing the bucket shares the rate.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate, capacity):
+        """
+            Changes the rate and capacity of a bucket that's already in use.
+        """
+        with self.lock:
+            self.rate = float(rate)
+            self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class CachedResponse:
+    """
+        Stand in for requests.Response when the body comes from the cache.
+    """
+
+    def __init__(self, content, headers=None):
+        self.status_code = 200
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return get_json_codec().loads(self.content)
+
+
+class ResponseCache:
+    """
+        On disk SQLite cache of Genius API response bodies.
+
+        Bodies are stored zlib compressed and keyed by endpoint + params.
+        Entries past their TTL are revalidated with ETag / Last-Modified when
+        Genius gave us those headers. Once the cache is bigger than max_bytes
+        the least recently used entries are evicted.
+    """
+
+    def __init__(self, filename, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        # --workers processes share the cache file, so wait on their writes.
+        self.connection = sqlite3.connect(filename, timeout=30,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, "
+            "last_modified TEXT, stored_at REAL NOT NULL, "
+            "last_accessed REAL NOT NULL, size INTEGER NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_accessed "
+            "ON responses (last_accessed)")
+        self.connection.commit()
+        row = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self.total_bytes = row[0]
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def take_stats(self):
+        """
+            Returns the stats counted so far and starts over, for --workers
+            processes to send back to the parent.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            self.stats.clear()
+        return stats
+
+    def get(self, key):
+        """
+            Returns (body, etag, last_modified, stored_at) or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses "
+                "WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]), row[1], row[2], row[3]
+
+    def touch(self, key, refreshed=False):
+        """
+            Marks an entry as used. refreshed=True also restarts its TTL.
+        """
+        now = time.time()
+        with self.lock:
+            if refreshed:
+                self.connection.execute(
+                    "UPDATE responses SET last_accessed = ?, stored_at = ? "
+                    "WHERE key = ?", (now, now, key))
+            else:
+                self.connection.execute(
+                    "UPDATE responses SET last_accessed = ? WHERE key = ?",
+                    (now, key))
+            self.connection.commit()
+
+    def put(self, key, body, etag=None, last_modified=None):
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self.lock:
+            old = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.total_bytes -= old[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, compressed, etag, last_modified, now, now,
+                 len(compressed)))
+            self.total_bytes += len(compressed)
+            self.stats["stores"] += 1
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """
+            Drops least recently used entries until we're at 90% of
+            max_bytes. Caller must hold self.lock.
+        """
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_accessed "
+                "LIMIT 100").fetchall()
+            if len(rows) == 0:
+                break
+            for key, size in rows:
+                self.connection.execute("DELETE FROM responses WHERE key = ?",
+                                        (key,))
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                if self.total_bytes <= target:
+                    break
+
+    def summary(self):
+        with self.lock:
+            entries = self.connection.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+        summary = dict(self.stats)
+        summary["entries"] = entries
+        summary["bytes"] = self.total_bytes
+        return summary
+
+
+def get_cache_key(path, params=None):
+    """
+        Utils function: Builds the cache key for an endpoint + params.
+    """
+    if not params:
+        return path
+    return path + "?" + urllib.parse.urlencode(sorted(params.items()))
+
+
+def get_endpoint_type(path):
+    """
+        Utils function: Maps an API path to its key in cache_ttls.
+    """
+    parts = path.strip("/").split("/")
+    if parts[0] == "artists" and len(parts) > 2 and parts[2] == "songs":
+        return "artist_songs"
+    return parts[0]
+
+
+class GeniusClient:
+    """
+        Owns the pooled requests.Session used for every Genius API call.
+
+        Calls are throttled by a shared TokenBucket and retried with
+        exponential backoff on connection errors, 429s and 5xx responses.
+        A Retry-After header from Genius always wins over our own backoff.
+    """
+
+    def __init__(self, token, url=None, cache=None):
+        import requests
+        import requests.adapters
+
+        self.base_url = url or base_url
+        self.cache = cache
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": "Bearer " + str(token)})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = TokenBucket(requests_per_second, burst_size)
+
+    def get(self, path, params=None):
+        """
+            GETs base_url + path, going through the response cache when we
+            have one. Returns a requests.Response or a CachedResponse.
+        """
+        endpoint = get_endpoint_type(path)
+        ttl = cache_ttls.get(endpoint, 0)
+        if self.cache is None or ttl <= 0:
+            return self.fetch(path, params)
+        key = get_cache_key(path, params)
+        cached = self.cache.get(key)
+        if cached is None:
+            self.count_cache(endpoint, "misses")
+            r = self.fetch(path, params)
+        else:
+            body, etag, last_modified, stored_at = cached
+            if time.time() - stored_at < ttl:
+                logger.debug("Cache hit for " + key)
+                self.count_cache(endpoint, "hits")
+                self.cache.touch(key)
+                return CachedResponse(body)
+            conditional_headers = {}
+            if etag is not None:
+                conditional_headers["If-None-Match"] = etag
+            if last_modified is not None:
+                conditional_headers["If-Modified-Since"] = last_modified
+            if len(conditional_headers) == 0:
+                self.count_cache(endpoint, "expired")
+                r = self.fetch(path, params)
+            else:
+                r = self.fetch(path, params, conditional_headers)
+                if r.status_code == 304:
+                    logger.debug("Cache entry for " + key + " is still good.")
+                    self.count_cache(endpoint, "revalidated")
+                    self.cache.touch(key, refreshed=True)
+                    return CachedResponse(body)
+                self.count_cache(endpoint, "expired")
+        if r.status_code == 200:
+            self.cache.put(key, r.content, r.headers.get("ETag"),
+                           r.headers.get("Last-Modified"))
+        return r
+
+    def count_cache(self, endpoint, result):
+        self.cache.count(result)
+        metrics.record_cache(endpoint, result)
+
+    def fetch(self, path, params=None, headers=None):
+        """
+            GETs base_url + path from the API. Returns the last
+            requests.Response we got, or raises the last connection error
+            once we are out of retries.
+        """
+        import requests
+
+        search_url = self.base_url + path
+        endpoint = get_endpoint_type(path)
+        attempt = 0
+        while True:
+            with metrics.stage("rate_limiter_wait"):
+                self.limiter.acquire()
+            started_at = time.perf_counter()
+            try:
+                r = self.session.get(search_url, params=params,
+                                     headers=headers)
+            except requests.exceptions.RequestException as e:
+                metrics.record_request(endpoint, "error",
+                                       time.perf_counter() - started_at, 0)
+                if attempt >= max_retries:
+                    raise
+                logger.debug("Connection error calling " + search_url +
+                             ": " + str(e))
+                wait_time = backoff_factor * (2 ** attempt)
+            else:
+                metrics.record_request(endpoint, r.status_code,
+                                       time.perf_counter() - started_at,
+                                       len(r.content))
+                if r.status_code not in retry_status_codes or \
+                        attempt >= max_retries:
+                    return r
+                logger.debug("Got status " + str(r.status_code) + " from " +
+                             search_url + ". Retrying.")
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                wait_time = max(backoff_factor * (2 ** attempt), retry_after)
+            attempt += 1
+            metrics.record_retry(endpoint)
+            time.sleep(wait_time)
+
+
+genius_client = None
+genius_client_lock = threading.Lock()
+# ResponseCache stats sent back by --workers processes.
+worker_cache_stats = collections.Counter()
+
+
+def get_genius_client():
+    """
+        Returns the shared GeniusClient, creating it on first use.
+    """
+    global genius_client
+    with genius_client_lock:
+        if genius_client is None:
+            cache = None
+            if cache_enabled is True:
+                cache = ResponseCache(cache_filename, cache_max_bytes)
+            genius_client = GeniusClient(get_api_token(), cache=cache)
+        return genius_client
+
+
+def report_stats(json_filename=None, prometheus_filename=None,
+                 log_summary=True):
+    """
+        Utils function: Logs this run's metrics summary and/or dumps it as
+        JSON or a Prometheus textfile.
+    """
+    summary = metrics.summary()
+    if json_filename is not None:
+        temp_filename = json_filename + "." + str(os.getpid()) + ".tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        os.replace(temp_filename, json_filename)
+    if prometheus_filename is not None:
+        metrics.write_prometheus_textfile(prometheus_filename)
+    if log_summary is not True:
+        return
+    logger.info("Run stats after %.1fs:" % summary["wall_seconds"])
+    for endpoint, endpoint_stats in summary["endpoints"].items():
+        latency = endpoint_stats["latency_seconds"]
+        logger.info("  " + endpoint + ": " + str(endpoint_stats["requests"]) +
+                    " requests (%.1f/s), p50 %.0f ms, p95 %.0f ms, " %
+                    (endpoint_stats["requests_per_second"],
+                     latency["p50"] * 1000, latency["p95"] * 1000) +
+                    str(endpoint_stats["retries"]) + " retries, " +
+                    str(endpoint_stats["bytes_received"]) + " bytes, " +
+                    "statuses " + str(endpoint_stats["status_codes"]) +
+                    ", cache " + str(endpoint_stats["cache"]))
+    for stage, stage_stats in summary["stages"].items():
+        logger.info("  " + stage + ": %.3fs over " % stage_stats["seconds"] +
+                    str(stage_stats["calls"]) + " calls")
+
+
+def get_api_token():
+    """
+        Returns the Genius API token from settings.ini. It's only read when
+        we make our first API call.
+    """
+    global api_token
+    if api_token is None:
+        api_token = config["API_KEYS"]["GeniusAPI"]
+    return api_token
+
+
+class JSONCodec:
+    """
+        Decodes and encodes JSON with orjson, msgspec or the json module.
+
+        loads( ) takes bytes or str. dumps( ) returns compact str (orjson
+        and msgspec don't escape non ASCII characters, so write it as
+        UTF-8). When msgspec is installed, loads_artist_songs_page( )
+        decodes artists/:id/songs pages into dicts holding only the song
+        fields Kanyus uses, whatever codec is picked for the rest.
+    """
+
+    names = ("orjson", "msgspec", "json")
+
+    def __init__(self, name="auto"):
+        if name == "auto":
+            for name in self.names:
+                if name == "json" or can_import(name):
+                    break
+        self.name = name
+        if name == "orjson":
+            import orjson
+            self.loads = orjson.loads
+            self.dumps_bytes = orjson.dumps
+        elif name == "msgspec":
+            import msgspec.json
+            self.loads = msgspec.json.decode
+            self.dumps_bytes = msgspec.json.encode
+        elif name == "json":
+            self.loads = json.loads
+        else:
+            raise ValueError("Unknown JSON codec: " + str(name))
+        self.typed_decoding = name != "json" and can_import("msgspec")
+        self.artist_songs_page_decoder = None
+
+    def dumps(self, obj):
+        if self.name == "json":
+            return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads_artist_songs_page(self, content):
+        if self.typed_decoding is False:
+            return self.loads(content)
+        if self.artist_songs_page_decoder is None:
+            self.artist_songs_page_decoder = get_artist_songs_page_decoder()
+        return self.artist_songs_page_decoder.decode(content)
+
+
+def can_import(module_name):
+    """
+        Utils function: True if module_name is installed, without importing
+        it.
+    """
+    import importlib.util
+
+    return importlib.util.find_spec(module_name) is not None
+
+
+def get_artist_songs_page_decoder():
+    """
+        Returns a msgspec decoder for artists/:id/songs responses that keeps
+        only the song fields the filtering and get_song_record( ) read.
+        Every other field of the (big) song objects is skipped, not decoded.
+    """
+    from typing import List, Optional, TypedDict
+
+    import msgspec.json
+
+    class PrimaryArtist(TypedDict, total=False):
+        id: int
+        name: str
+
+    class ReleaseDateComponents(TypedDict, total=False):
+        year: Optional[int]
+        month: Optional[int]
+        day: Optional[int]
+
+    class SongStats(TypedDict, total=False):
+        pageviews: Optional[int]
+        hot: Optional[bool]
+
+    class Song(TypedDict, total=False):
+        id: int
+        title: str
+        url: str
+        annotation_count: int
+        primary_artist: PrimaryArtist
+        release_date_components: Optional[ReleaseDateComponents]
+        stats: Optional[SongStats]
+
+    class ArtistSongsPage(TypedDict, total=False):
+        songs: List[Song]
+        next_page: Optional[int]
+
+    class ArtistSongsResponse(TypedDict, total=False):
+        meta: dict
+        response: ArtistSongsPage
+
+    return msgspec.json.Decoder(ArtistSongsResponse)
+
+
+def get_json_codec():
+    """
+        Returns the JSONCodec picked by json_codec_name, creating it on
+        first use.
+    """
+    global json_codec
+    if json_codec is None:
+        json_codec = JSONCodec(json_codec_name)
+        logger.debug("Using the " + json_codec.name + " JSON codec.")
+    return json_codec
+
+
+def report_cache_stats():
+    """
+        Utils function: Logs the response cache statistics for this run.
+    """
+    cache = None
+    if genius_client is not None:
+        cache = genius_client.cache
+    if cache is None and len(worker_cache_stats) == 0:
+        logger.info("The response cache was not used this run.")
+        return
+    if cache is None:
+        # Only --workers processes used it, we just need its size.
+        cache = ResponseCache(cache_filename, cache_max_bytes)
+    summary = cache.summary()
+    for stat, count in worker_cache_stats.items():
+        summary[stat] = summary.get(stat, 0) + count
+    logger.info("Response cache stats: " +
+                json.dumps(summary, sort_keys=True))
+
+
+def parse_retry_after(value):
+    """
+        Utils function: Turns a Retry-After header (seconds or an HTTP date)
+        into a number of seconds to wait. Returns 0 if it can't be parsed.
+    """
+    if value is None:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class GeniusAPIError(Exception):
+    """
+        Raised when a Genius API call doesn't come back with a 200.
+        status_code is None if we never got a response at all.
+    """
+
+    def __init__(self, message, status_code=None, url=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+
+
+class GeniusNotFoundError(GeniusAPIError):
+    pass
+
+
+class GeniusRateLimitError(GeniusAPIError):
+    pass
+
+
+def request_genius(path, params=None):
+    """
+        Calls a Genius API endpoint through the shared client.
+
+        Returns the response if it was a 200 and raises GeniusAPIError (or
+        one of its subclasses) otherwise. Every sync wrapper and
+        AsyncGeniusClient go through here.
+    """
+    import requests
+
+    try:
+        r = get_genius_client().get(path, params)
+    except requests.exceptions.RequestException as e:
+        raise GeniusAPIError("Could not call " + path + ": " + str(e),
+                             url=path)
+    if r.status_code == 200:
+        return r
+    message = "Call to " + path + " returned " + str(r.status_code) + ": " + \
+        str(r.text)
+    if r.status_code == 404:
+        raise GeniusNotFoundError(message, r.status_code, path)
+    if r.status_code == 429:
+        raise GeniusRateLimitError(message, r.status_code, path)
+    raise GeniusAPIError(message, r.status_code, path)
+
+
+def request_genius_json(path, params=None):
+    """
+        Same as request_genius( ) but returns the body decoded with
+        get_json_codec( ).
+    """
+    return get_json_codec().loads(request_genius(path, params).content)
+
+
+class MappingData(dict):
+    """
+        The loaded mapping. It's the same dict we save as JSON, plus lookup
+        indexes we keep alongside it (see get_song_index( ),
+        get_artist_index( ) and get_query_index( )).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.song_indexes = {}
+        self.artist_index = None
+        self.query_index = None
+
+
+class CompactSong:
+    """
+        One songs_to_annotate entry without a dict per song. song_url is
+        kept as the slug between song_url_prefix and song_url_suffix.
+        date_added is None for songs added before we recorded it.
+
+        Songs that don't have exactly the usual keys, in the usual order,
+        are kept as-is in extra so to_dict( ) always gives back what
+        from_dict( ) was given.
+    """
+
+    __slots__ = ("song_name", "song_id", "song_note_amt", "song_url_slug",
+                 "date_added", "extra")
+
+    keys = ("song_name", "song_id", "song_note_amt", "song_url")
+    dated_keys = keys + ("date_added",)
+    song_url_prefix = "https://genius.com/"
+    song_url_suffix = "-lyrics"
+
+    def __init__(self, song_name=None, song_id=None, song_note_amt=None,
+                 song_url_slug=None, date_added=None, extra=None):
+        self.song_name = song_name
+        self.song_id = song_id
+        self.song_note_amt = song_note_amt
+        self.song_url_slug = song_url_slug
+        self.date_added = date_added
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, song):
+        song_keys = tuple(song)
+        song_url = song.get("song_url")
+        if song_keys not in (cls.keys, cls.dated_keys) or \
+                not isinstance(song_url, str) or \
+                not song_url.startswith(cls.song_url_prefix) or \
+                not song_url.endswith(cls.song_url_suffix) or \
+                len(song_url) < len(cls.song_url_prefix) + \
+                len(cls.song_url_suffix) or \
+                (song_keys == cls.dated_keys and
+                 not isinstance(song["date_added"], str)):
+            return cls(extra=dict(song))
+        return cls(song["song_name"], song["song_id"], song["song_note_amt"],
+                   song_url[len(cls.song_url_prefix):
+                            len(song_url) - len(cls.song_url_suffix)],
+                   song.get("date_added"))
+
+    @property
+    def song_url(self):
+        if self.extra is not None:
+            return self.extra.get("song_url")
+        return self.song_url_prefix + self.song_url_slug + \
+            self.song_url_suffix
+
+    def to_dict(self):
+        if self.extra is not None:
+            return dict(self.extra)
+        song = {"song_name": self.song_name, "song_id": self.song_id,
+                "song_note_amt": self.song_note_amt,
+                "song_url": self.song_url}
+        if self.date_added is not None:
+            song["date_added"] = self.date_added
+        return song
+
+    def __getitem__(self, key):
+        if self.extra is not None:
+            return self.extra[key]
+        if key not in self.dated_keys or \
+                (key == "date_added" and self.date_added is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class CompactMapping:
+    """
+        Read only, memory light copy of a loaded mapping for big mappings:
+        songs are CompactSong objects and songs_to_annotate is keyed by
+        integer artist IDs. The other top level keys are kept as they are.
+
+        to_mapping_data( ) gives back the exact mapping it was built from.
+    """
+
+    __slots__ = ("key_order", "songs_to_annotate", "string_artist_keys",
+                 "other")
+
+    def __init__(self, mapping_data):
+        self.key_order = list(mapping_data)
+        self.songs_to_annotate = {}
+        # Artist keys that don't survive str(int(key)) stay strings.
+        self.string_artist_keys = set()
+        self.other = {}
+        for key, value in mapping_data.items():
+            if key != "songs_to_annotate":
+                self.other[key] = value
+                continue
+            for artist_key, songs in value.items():
+                compact_key = get_compact_artist_key(artist_key)
+                if isinstance(compact_key, str):
+                    self.string_artist_keys.add(compact_key)
+                self.songs_to_annotate[compact_key] = [
+                    CompactSong.from_dict(song) for song in songs]
+
+    def __getitem__(self, key):
+        return self.other[key]
+
+    def get(self, key, default=None):
+        return self.other.get(key, default)
+
+    def artist_songs(self, artist_id):
+        """
+            Returns the artist's CompactSong list, [] if we have none.
+        """
+        return self.songs_to_annotate.get(get_compact_artist_key(artist_id),
+                                          [])
+
+    def song_count(self):
+        return sum(len(songs) for songs in self.songs_to_annotate.values())
+
+    def get_songs_to_annotate(self):
+        """
+            songs_to_annotate keyed by string artist IDs, like a loaded
+            mapping's. The CompactSong lists aren't copied.
+        """
+        return {str(artist_key): songs
+                for artist_key, songs in self.songs_to_annotate.items()}
+
+    def to_mapping_data(self):
+        mapping_data = MappingData()
+        for key in self.key_order:
+            if key != "songs_to_annotate":
+                mapping_data[key] = self.other[key]
+                continue
+            mapping_data[key] = {
+                str(artist_key): [song.to_dict() for song in songs]
+                for artist_key, songs in self.songs_to_annotate.items()}
+        return mapping_data
+
+
+def get_compact_artist_key(artist_key):
+    """
+        Utils function: The int form of a songs_to_annotate key, or the key
+        itself if it isn't a plain integer.
+    """
+    if isinstance(artist_key, int):
+        return artist_key
+    try:
+        compact_key = int(artist_key)
+    except (TypeError, ValueError):
+        return artist_key
+    if str(compact_key) != artist_key:
+        return artist_key
+    return compact_key
+
+
+class JsonMappingStore:
+    """
+        Mapping store for the original artist_song_id_mapping.json format.
+
+        The JSON file is a snapshot. Changes are appended as JSON lines to
+        <filename>.journal, so recording a few songs costs O(change), and
+        load( ) replays the journal over the snapshot. Once the journal is
+        bigger than journal_max_bytes it is compacted into a new snapshot,
+        written to a temp file and swapped in with os.replace. Inside
+        deferred( ) changes are buffered and appended in one go at the end.
+
+        Every read and write holds an advisory lock on <filename>.lock so
+        several Kanyus processes can share one mapping.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.lock_filename = filename + ".lock"
+        self.lock = threading.RLock()
+        self.lock_depth = 0
+        self.defer_depth = 0
+        self.pending = []
+
+    @contextlib.contextmanager
+    def locked(self, exclusive=True):
+        """
+            Holds the thread lock and, on the outermost call, the advisory
+            file lock. Without fcntl (Windows) only the thread lock is held.
+        """
+        with self.lock:
+            if self.lock_depth > 0 or fcntl is None:
+                self.lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self.lock_depth -= 1
+                return
+            with open(self.lock_filename, "a") as lock_file:
+                fcntl.flock(lock_file.fileno(),
+                            fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self.lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self.lock_depth -= 1
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load(self):
+        with self.locked(exclusive=False):
+            with open(self.filename, "rb") as f:
+                mapping_data = get_json_codec().loads(f.read())
+            for entry in self.read_journal():
+                apply_journal_entry(mapping_data, entry)
+        return mapping_data
+
+    def load_artist(self, artist_name):
+        """
+            Loads every artist entry but only artist_name's songs, without
+            parsing the rest of the snapshot (see dump_mapping_json( )).
+            Snapshots that aren't laid out for this, like mappings written
+            by older versions, are rewritten first (see upgrade_snapshot( )).
+
+            Returns the partial mapping or None if the snapshot still isn't
+            laid out for this, in which case the caller should load( )
+            instead.
+        """
+        mapping_data = self.read_artist(artist_name)
+        if mapping_data is None and self.upgrade_snapshot() is True:
+            mapping_data = self.read_artist(artist_name)
+        return mapping_data
+
+    def read_artist(self, artist_name):
+        """
+            load_artist( ) without the upgrade. Returns None if the snapshot
+            isn't laid out for it.
+        """
+        codec = get_json_codec()
+        with self.locked(exclusive=False):
+            with open(self.filename, encoding="utf-8") as f:
+                mapping_data = self.read_head(f)
+                if mapping_data is None:
+                    return None
+                journal = self.read_journal()
+                mapping_data["songs_to_annotate"] = {}
+                for entry in journal:
+                    if entry["op"] in mapping_wide_ops:
+                        apply_journal_entry(mapping_data, entry)
+                names_index, artist_entries = get_artist_index(mapping_data)
+                artist_id = names_index.get(normalize_artist_name(
+                    artist_name))
+                if artist_id is None:
+                    return mapping_data
+                artist_key = str(artist_id)
+                prefix = codec.dumps(artist_key) + ": "
+                for line in f:
+                    if line.startswith(prefix):
+                        songs = line[len(prefix):].rstrip().rstrip(",")
+                        mapping_data["songs_to_annotate"][artist_key] = \
+                            codec.loads(songs)
+                        break
+            for entry in journal:
+                if entry["op"] not in mapping_wide_ops and \
+                        entry["artist_id"] == artist_key:
+                    apply_journal_entry(mapping_data, entry)
+        return mapping_data
+
+    def load_song_ids(self):
+        """
+            Loads everything but the songs, plus the set of every song ID
+            we have. Used to merge snapshots in (see
+            import_mapping_snapshots( )).
+
+            Song IDs are picked out of each artist's line of the snapshot
+            (see dump_mapping_json( )) with a regex, so no song dicts are
+            built. Only the journal, which is small, is parsed.
+        """
+        codec = get_json_codec()
+        with self.locked(exclusive=False):
+            with open(self.filename, encoding="utf-8") as f:
+                mapping_data = self.read_head(f)
+                if mapping_data is None:
+                    mapping_data = self.load()
+                    artist_song_ids = {
+                        artist_key: {song["song_id"] for song in songs}
+                        for artist_key, songs in
+                        mapping_data["songs_to_annotate"].items()}
+                    mapping_data["songs_to_annotate"] = {}
+                    return mapping_data, set().union(
+                        *artist_song_ids.values())
+                artist_song_ids = {}
+                for line in f:
+                    match = re.match(r'("(?:[^"\\]|\\.)*"): ', line)
+                    if match is None:
+                        continue
+                    # A '"song_id":' can't be inside a string, the quotes
+                    # would be escaped there.
+                    artist_song_ids[codec.loads(match.group(1))] = {
+                        codec.loads(song_id) for song_id in re.findall(
+                            r'"song_id":\s*("(?:[^"\\]|\\.)*"|-?\d+)',
+                            line)}
+            for entry in self.read_journal():
+                op = entry["op"]
+                if op in mapping_wide_ops:
+                    apply_journal_entry(mapping_data, entry)
+                elif op == "songs":
+                    artist_song_ids.setdefault(
+                        entry["artist_id"], set()).update(
+                            song["song_id"] for song in entry["songs"])
+                elif op == "replace_songs":
+                    artist_song_ids[entry["artist_id"]] = {
+                        song["song_id"] for song in entry["songs"]}
+                elif op == "remove_songs":
+                    artist_song_ids.pop(entry["artist_id"], None)
+        mapping_data["songs_to_annotate"] = {}
+        return mapping_data, set().union(*artist_song_ids.values())
+
+    def load_without_songs(self):
+        """
+            Loads every top level key but songs_to_annotate, which is left
+            empty, without parsing any songs. Snapshots that aren't laid out
+            for this are rewritten first, like load_artist( ) does.
+
+            Returns None if the snapshot still isn't laid out for this.
+        """
+        mapping_data = self.read_without_songs()
+        if mapping_data is None and self.upgrade_snapshot() is True:
+            mapping_data = self.read_without_songs()
+        return mapping_data
+
+    def read_without_songs(self):
+        with self.locked(exclusive=False):
+            with open(self.filename, encoding="utf-8") as f:
+                mapping_data = self.read_head(f)
+            if mapping_data is None:
+                return None
+            for entry in self.read_journal():
+                if entry["op"] in mapping_wide_ops:
+                    apply_journal_entry(mapping_data, entry)
+        mapping_data["songs_to_annotate"] = {}
+        return mapping_data
+
+    def upgrade_snapshot(self):
+        """
+            Rewrites a snapshot that isn't laid out by dump_mapping_json( ),
+            like the single line mappings older versions wrote, folding the
+            journal in like compact( ) does. It's done once, under the
+            exclusive lock, the first time a partial read finds it. Nothing
+            is done if we already hold the lock, since it might be shared.
+
+            Returns True if the snapshot is laid out for partial reads now.
+        """
+        with self.lock:
+            if self.lock_depth > 0:
+                return False
+            with self.locked():
+                with open(self.filename, encoding="utf-8") as f:
+                    if self.read_head(f) is not None:
+                        # Another process got here first.
+                        return True
+                logger.debug("Rewriting " + str(self.filename) +
+                             " with one artist per line.")
+                try:
+                    self.write_snapshot(self.load())
+                except OSError as e:
+                    logger.debug("We were unable to rewrite the mapping: " +
+                                 str(e))
+                    return False
+        return True
+
+    def read_head(self, f):
+        """
+            Reads the lines before songs_to_annotate (see
+            dump_mapping_json( )) and leaves f at the first artist's songs.
+
+            Returns those keys as a dict or None if the snapshot isn't laid
+            out this way.
+        """
+        codec = get_json_codec()
+        mapping_data = {}
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("{"):
+                line = line[1:]
+            if line == '"songs_to_annotate": {':
+                return mapping_data
+            if not line.endswith(","):
+                return None
+            mapping_data.update(codec.loads("{" + line[:-1] + "}"))
+        return None
+
+    def read_journal(self):
+        if not os.path.exists(self.journal_filename):
+            return []
+        codec = get_json_codec()
+        entries = []
+        with open(self.journal_filename, "rb") as f:
+            for line in f:
+                try:
+                    entries.append(codec.loads(line))
+                except ValueError:
+                    # A crash mid append can leave half a line at the end.
+                    logger.debug("Skipping a broken mapping journal line.")
+        return entries
+
+    def save(self, mapping_data):
+        """
+            Replaces the whole mapping with mapping_data.
+        """
+        if self.defer_depth > 0:
+            self.pending = [("snapshot", mapping_data)]
+            return
+        with self.locked():
+            self.write_snapshot(mapping_data)
+
+    def write_snapshot(self, mapping_data):
+        """
+            Atomically writes mapping_data as the snapshot and empties the
+            journal. Caller must hold the exclusive lock.
+        """
+        with metrics.stage("mapping_snapshot_write"):
+            self.write_snapshot_file(mapping_data)
+
+    def write_snapshot_file(self, mapping_data):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        temp_filename = os.path.join(directory, "." +
+                                     os.path.basename(self.filename) + "." +
+                                     str(os.getpid()) + ".tmp")
+        with open(temp_filename, 'w', encoding="utf-8") as f:
+            dump_mapping_json(mapping_data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.filename)
+        # Replaying the journal over a snapshot that already has its changes
+        # is harmless, so a crash between these two steps is fine.
+        open(self.journal_filename, 'w').close()
+
+    def append(self, entries):
+        if self.defer_depth > 0:
+            self.pending.extend(("entry", entry) for entry in entries)
+            return
+        with self.locked(), metrics.stage("mapping_journal_append"):
+            with open(self.journal_filename, 'a+b') as f:
+                # Start on a fresh line if a crash left half a line behind.
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                codec = get_json_codec()
+                for entry in entries:
+                    f.write((codec.dumps(entry) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.getsize(self.journal_filename) > journal_max_bytes:
+                self.compact()
+
+    def compact(self):
+        """
+            Folds the journal into a new snapshot. We rebuild from what's on
+            disk, not from our mapping_data, so changes other processes
+            appended aren't lost.
+        """
+        with self.locked():
+            logger.debug("Compacting the mapping journal.")
+            self.write_snapshot(self.load())
+
+    def record_artist(self, mapping_data, artist_id, names):
+        self.append([{"op": "artist", "artist_id": artist_id,
+                      "names": names}])
+
+    def record_songs(self, mapping_data, artist_id, songs):
+        self.append([{"op": "songs", "artist_id": str(artist_id),
+                      "songs": songs}])
+
+    def replace_songs(self, mapping_data, artist_id, songs):
+        self.append([{"op": "replace_songs", "artist_id": str(artist_id),
+                      "songs": songs}])
+
+    def remove_artist_songs(self, mapping_data, artist_id):
+        self.append([{"op": "remove_songs", "artist_id": str(artist_id)}])
+
+    def record_crawl_state(self, mapping_data, artist_id, crawl_state):
+        self.append([{"op": "crawl_state", "artist_id": str(artist_id),
+                      "crawl_state": crawl_state}])
+
+    def remove_crawl_state(self, mapping_data, artist_id):
+        self.append([{"op": "remove_crawl_state",
+                      "artist_id": str(artist_id)}])
+
+    def record_annotation_coverage(self, mapping_data, coverage):
+        self.append([{"op": "annotation_coverage", "coverage": coverage}])
+
+    @contextlib.contextmanager
+    def deferred(self):
+        with self.lock:
+            self.defer_depth += 1
+            try:
+                yield self
+            finally:
+                self.defer_depth -= 1
+            if self.defer_depth > 0 or len(self.pending) == 0:
+                return
+            pending = self.pending
+            self.pending = []
+            with self.locked():
+                entries = []
+                for kind, value in pending:
+                    if kind == "snapshot":
+                        self.write_snapshot(value)
+                    else:
+                        entries.append(value)
+                if len(entries) > 0:
+                    self.append(entries)
+
+
+def dump_mapping_json(mapping_data, f):
+    """
+        Utils function: Writes mapping_data as JSON with every top level key
+        on its own line and songs_to_annotate last, one artist per line.
+        It's still plain JSON, but JsonMappingStore.load_artist( ) can find
+        one artist's songs without parsing everyone else's.
+    """
+    codec = get_json_codec()
+    f.write("{")
+    for key, value in mapping_data.items():
+        if key != "songs_to_annotate":
+            f.write(codec.dumps(key) + ": " + codec.dumps(value) + ",\n")
+    f.write('"songs_to_annotate": {')
+    separator = "\n"
+    for artist_key, songs in mapping_data["songs_to_annotate"].items():
+        f.write(separator + codec.dumps(str(artist_key)) + ": " +
+                codec.dumps(songs))
+        separator = ",\n"
+    f.write("\n}}\n")
+
+
+# Journal ops that aren't about one artist's songs. load_artist( ) applies
+# these whatever artist it loads.
+mapping_wide_ops = ("artist", "crawl_state", "remove_crawl_state",
+                    "annotation_coverage")
+
+
+def apply_journal_entry(mapping_data, entry):
+    """
+        Utils function: Applies one JsonMappingStore journal entry to
+        mapping_data. Entries are idempotent.
+    """
+    op = entry["op"]
+    if op == "artist":
+        for artist in mapping_data["artists"]:
+            if artist["ID"] == entry["artist_id"]:
+                for name in entry["names"]:
+                    if name not in artist["names"]:
+                        artist["names"].append(name)
+                return
+        mapping_data["artists"].append({"names": list(entry["names"]),
+                                        "ID": entry["artist_id"]})
+    elif op == "songs":
+        artist_songs = mapping_data["songs_to_annotate"].setdefault(
+            entry["artist_id"], [])
+        song_index = {song["song_id"]: song for song in artist_songs}
+        for song in entry["songs"]:
+            if song["song_id"] in song_index:
+                song_index[song["song_id"]].update(song)
+            else:
+                artist_songs.append(song)
+                song_index[song["song_id"]] = song
+    elif op == "replace_songs":
+        mapping_data["songs_to_annotate"][entry["artist_id"]] = entry["songs"]
+    elif op == "remove_songs":
+        mapping_data["songs_to_annotate"].pop(entry["artist_id"], None)
+    elif op == "crawl_state":
+        mapping_data.setdefault("crawl_state", {})[entry["artist_id"]] = \
+            entry["crawl_state"]
+    elif op == "remove_crawl_state":
+        mapping_data.get("crawl_state", {}).pop(entry["artist_id"], None)
+    elif op == "annotation_coverage":
+        mapping_data.setdefault("annotation_coverage", {}).update(
+            entry["coverage"])
+    else:
+        logger.debug("Unknown mapping journal op: " + str(op))
+
+
+class SqliteMappingStore:
+    """
+        Mapping store backed by an indexed SQLite database.
+
+        Artists, their aliases and songs_to_annotate live in their own tables
+        so each change is a small transactional upsert instead of a rewrite
+        of the whole mapping. load( ) still returns the JSON shaped dict the
+        rest of Kanyus works with.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.defer_depth = 0
+        self.lock = threading.RLock()
+        # Wait for other Kanyus processes' transactions instead of failing
+        # with "database is locked" after sqlite3's default 5 seconds.
+        self.connection = sqlite3.connect(filename, timeout=30,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS artists ("
+            "id INTEGER PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            "name TEXT NOT NULL, artist_id INTEGER NOT NULL, "
+            "PRIMARY KEY (name, artist_id));"
+            "CREATE INDEX IF NOT EXISTS aliases_artist_id "
+            "ON aliases (artist_id);"
+            "CREATE TABLE IF NOT EXISTS songs ("
+            "artist_id INTEGER NOT NULL, song_id INTEGER NOT NULL, "
+            "song_name TEXT, song_note_amt INTEGER, song_url TEXT, "
+            "date_added TEXT, PRIMARY KEY (artist_id, song_id));"
+            "CREATE INDEX IF NOT EXISTS songs_song_id ON songs (song_id);"
+            "CREATE TABLE IF NOT EXISTS crawl_state ("
+            "artist_id INTEGER PRIMARY KEY, state TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS annotation_coverage ("
+            "song_id INTEGER PRIMARY KEY, summary TEXT NOT NULL);")
+        # Databases from before date_added was recorded.
+        song_columns = [row[1] for row in self.connection.execute(
+            "PRAGMA table_info(songs)")]
+        if "date_added" not in song_columns:
+            self.connection.execute(
+                "ALTER TABLE songs ADD COLUMN date_added TEXT")
+        self.connection.commit()
+
+    def load(self):
+        with self.lock:
+            songs_to_annotate = {}
+            for row in self.connection.execute(
+                    "SELECT artist_id, song_id, song_name, song_note_amt, "
+                    "song_url, date_added FROM songs ORDER BY rowid"):
+                songs_to_annotate.setdefault(str(row[0]), []).append(
+                    get_sqlite_song(row[1:]))
+            mapping_data = self.load_without_songs()
+            mapping_data["songs_to_annotate"] = songs_to_annotate
+        return mapping_data
+
+    def load_artists(self):
+        artists = collections.OrderedDict()
+        for (artist_id,) in self.connection.execute(
+                "SELECT id FROM artists ORDER BY rowid"):
+            artists[artist_id] = {"names": [], "ID": artist_id}
+        for name, artist_id in self.connection.execute(
+                "SELECT name, artist_id FROM aliases ORDER BY rowid"):
+            artists.setdefault(artist_id, {"names": [], "ID": artist_id})
+            artists[artist_id]["names"].append(name)
+        return list(artists.values())
+
+    def load_without_songs(self):
+        with self.lock:
+            crawl_state = {}
+            for artist_id, state in self.connection.execute(
+                    "SELECT artist_id, state FROM crawl_state"):
+                crawl_state[str(artist_id)] = json.loads(state)
+            annotation_coverage = {}
+            for song_id, summary in self.connection.execute(
+                    "SELECT song_id, summary FROM annotation_coverage"):
+                annotation_coverage[str(song_id)] = json.loads(summary)
+            return {"artists": self.load_artists(), "songs_to_annotate": {},
+                    "crawl_state": crawl_state,
+                    "annotation_coverage": annotation_coverage}
+
+    def load_song_ids(self):
+        """
+            Loads everything but the songs, plus the set of every song ID
+            we have. Used to merge snapshots in (see
+            import_mapping_snapshots( )).
+        """
+        with self.lock:
+            song_ids = {song_id for (song_id,) in self.connection.execute(
+                "SELECT song_id FROM songs")}
+            return self.load_without_songs(), song_ids
+
+    def load_artist(self, artist_name):
+        """
+            Loads every artist entry but only artist_name's songs, crawl
+            state and annotation coverage.
+        """
+        with self.lock:
+            mapping_data = {"artists": self.load_artists(),
+                            "songs_to_annotate": {}, "crawl_state": {},
+                            "annotation_coverage": {}}
+            names_index, artist_entries = get_artist_index(mapping_data)
+            artist_id = names_index.get(normalize_artist_name(artist_name))
+            if artist_id is None:
+                return mapping_data
+            songs = [get_sqlite_song(row) for row in self.connection.execute(
+                "SELECT song_id, song_name, song_note_amt, song_url, "
+                "date_added FROM songs WHERE artist_id = ? ORDER BY rowid",
+                (int(artist_id),))]
+            if len(songs) > 0:
+                mapping_data["songs_to_annotate"][str(artist_id)] = songs
+            row = self.connection.execute(
+                "SELECT state FROM crawl_state WHERE artist_id = ?",
+                (int(artist_id),)).fetchone()
+            if row is not None:
+                mapping_data["crawl_state"][str(artist_id)] = json.loads(
+                    row[0])
+            for song_id, summary in self.connection.execute(
+                    "SELECT annotation_coverage.song_id, summary "
+                    "FROM annotation_coverage JOIN songs "
+                    "ON songs.song_id = annotation_coverage.song_id "
+                    "WHERE songs.artist_id = ?", (int(artist_id),)):
+                mapping_data["annotation_coverage"][str(song_id)] = \
+                    json.loads(summary)
+        return mapping_data
+
+    def commit(self):
+        if self.defer_depth == 0:
+            self.connection.commit()
+
+    def save(self, mapping_data):
+        with self.lock, metrics.stage("mapping_save"):
+            self.connection.execute("DELETE FROM aliases")
+            self.connection.execute("DELETE FROM artists")
+            self.connection.execute("DELETE FROM songs")
+            self.connection.execute("DELETE FROM crawl_state")
+            self.connection.execute("DELETE FROM annotation_coverage")
+            for artist in mapping_data["artists"]:
+                self.insert_artist(artist["ID"], artist["names"])
+            for artist_id, songs in mapping_data["songs_to_annotate"].items():
+                self.insert_songs(artist_id, songs)
+            for artist_id, state in mapping_data.get("crawl_state",
+                                                     {}).items():
+                self.insert_crawl_state(artist_id, state)
+            self.insert_annotation_coverage(mapping_data.get(
+                "annotation_coverage", {}))
+            self.commit()
+
+    def insert_artist(self, artist_id, names):
+        self.connection.execute(
+            "INSERT OR IGNORE INTO artists (id) VALUES (?)", (artist_id,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO aliases (name, artist_id) VALUES (?, ?)",
+            [(name, artist_id) for name in names])
+
+    def insert_songs(self, artist_id, songs):
+        self.connection.executemany(
+            "INSERT INTO songs (artist_id, song_id, song_name, song_note_amt, "
+            "song_url, date_added) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (artist_id, song_id) DO UPDATE SET "
+            "song_name = excluded.song_name, "
+            "song_note_amt = excluded.song_note_amt, "
+            "song_url = excluded.song_url, "
+            "date_added = COALESCE(excluded.date_added, songs.date_added)",
+            [(int(artist_id), song["song_id"], song["song_name"],
+              song["song_note_amt"], song["song_url"],
+              song.get("date_added")) for song in songs])
+
+    def insert_crawl_state(self, artist_id, crawl_state):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO crawl_state (artist_id, state) "
+            "VALUES (?, ?)", (int(artist_id), json.dumps(crawl_state)))
+
+    def insert_annotation_coverage(self, coverage):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO annotation_coverage (song_id, summary) "
+            "VALUES (?, ?)", [(int(song_id), json.dumps(summary))
+                              for song_id, summary in coverage.items()])
+
+    def record_artist(self, mapping_data, artist_id, names):
+        with self.lock, metrics.stage("mapping_save"):
+            self.insert_artist(artist_id, names)
+            self.commit()
+
+    def record_crawl_state(self, mapping_data, artist_id, crawl_state):
+        with self.lock, metrics.stage("mapping_save"):
+            self.insert_crawl_state(artist_id, crawl_state)
+            self.commit()
+
+    def record_annotation_coverage(self, mapping_data, coverage):
+        with self.lock, metrics.stage("mapping_save"):
+            self.insert_annotation_coverage(coverage)
+            self.commit()
+
+    def remove_crawl_state(self, mapping_data, artist_id):
+        with self.lock, metrics.stage("mapping_save"):
+            self.connection.execute(
+                "DELETE FROM crawl_state WHERE artist_id = ?",
+                (int(artist_id),))
+            self.commit()
+
+    def record_songs(self, mapping_data, artist_id, songs):
+        with self.lock, metrics.stage("mapping_save"):
+            self.insert_songs(artist_id, songs)
+            self.commit()
+
+    def replace_songs(self, mapping_data, artist_id, songs):
+        with self.lock, metrics.stage("mapping_save"):
+            self.connection.execute("DELETE FROM songs WHERE artist_id = ?",
+                                    (int(artist_id),))
+            self.insert_songs(artist_id, songs)
+            self.commit()
+
+    def remove_artist_songs(self, mapping_data, artist_id):
+        with self.lock, metrics.stage("mapping_save"):
+            self.connection.execute("DELETE FROM songs WHERE artist_id = ?",
+                                    (int(artist_id),))
+            self.commit()
+
+    @contextlib.contextmanager
+    def deferred(self):
+        with self.lock:
+            self.defer_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.defer_depth -= 1
+                if self.defer_depth == 0:
+                    self.connection.rollback()
+                raise
+            self.defer_depth -= 1
+            self.commit()
+
+
+def get_sqlite_song(row):
+    """
+        Utils function: Turns a (song_id, song_name, song_note_amt, song_url,
+        date_added) row into a mapping song dict. date_added is left out
+        for songs added before we recorded it, like in JSON mappings.
+    """
+    song = {"song_name": row[1], "song_id": row[0], "song_note_amt": row[2],
+            "song_url": row[3]}
+    if row[4] is not None:
+        song["date_added"] = row[4]
+    return song
+
+
+mapping_stores = {}
+mapping_stores_lock = threading.Lock()
+
+
+def get_mapping_store(filename=None):
+    """
+        Utils function: Returns the mapping store for filename, picking
+        SQLite or JSON from the file extension.
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    with mapping_stores_lock:
+        if filename not in mapping_stores:
+            if filename.lower().endswith(sqlite_extensions):
+                mapping_stores[filename] = SqliteMappingStore(filename)
+            else:
+                mapping_stores[filename] = JsonMappingStore(filename)
+        return mapping_stores[filename]
+
+
+def import_mapping_file(json_filename, filename=None):
+    """
+        Utils function: One shot migration of a JSON mapping file into the
+        mapping store for filename (usually a SQLite database).
+
+        Returns 0 on success or 1 if an error occurred.
+    """
+    try:
+        mapping_data = JsonMappingStore(json_filename).load()
+        get_mapping_store(filename).save(mapping_data)
+    except Exception as e:
+        logger.debug("Error occurred when importing " + str(json_filename))
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
+    logger.debug("We imported " + str(len(mapping_data["artists"])) +
+                 " artists from " + str(json_filename))
+    return 0
+
+
+# MappingSnapshot files start and end with snapshot_magic. Row groups have
+# one block per column in snapshot_columns, in this order.
+snapshot_magic = b"KANYUS-SNAPSHOT1"
+snapshot_columns = (("artist_id", "int"), ("song_id", "int"),
+                    ("song_note_amt", "int"), ("song_name", "str"),
+                    ("song_url", "str"), ("date_added", "str"),
+                    ("extra", "str"))
+snapshot_int_range = (-2 ** 63, 2 ** 63 - 1)
+
+
+class MappingSnapshot:
+    """
+        Reader for the compressed columnar snapshots --export writes.
+
+        The file is snapshot_magic, the blocks, a zlib compressed JSON
+        header listing where every block is, the header's length and
+        snapshot_magic again:
+
+            "mapping"       every top level key but songs_to_annotate, JSON
+            row groups      up to snapshot_row_group_size songs each, one
+                            block per column in snapshot_columns
+
+        Integer columns are little endian int64 arrays. String columns are
+        a little endian uint32 array of UTF-8 lengths followed by the
+        strings. Songs that don't have the usual keys and types are kept
+        whole as JSON in "extra". The file is memory mapped and a block is
+        only decompressed when it's read, one row group at a time.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.data)
+        magic_size = len(snapshot_magic)
+        if len(view) < 2 * magic_size + 8 or \
+                view[:magic_size] != snapshot_magic or \
+                view[-magic_size:] != snapshot_magic:
+            view.release()
+            self.data.close()
+            raise ValueError(str(filename) + " isn't a Kanyus snapshot.")
+        header_end = len(view) - magic_size - 8
+        (header_size,) = struct.unpack(
+            "<Q", view[header_end:header_end + 8])
+        self.header = json.loads(zlib.decompress(
+            view[header_end - header_size:header_end]))
+        view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def read_block(self, block):
+        offset, size = block
+        with memoryview(self.data) as view:
+            return zlib.decompress(view[offset:offset + size])
+
+    def read_mapping(self):
+        """
+            Everything but songs_to_annotate.
+        """
+        return json.loads(self.read_block(self.header["mapping"]))
+
+    def read_row_group(self, row_group):
+        """
+            Returns {column name: list of values} for one row group.
+        """
+        row_count = row_group["rows"]
+        columns = {}
+        for name, kind in snapshot_columns:
+            raw = self.read_block(row_group["columns"][name])
+            if kind == "int":
+                values = array.array("q")
+                values.frombytes(raw)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                columns[name] = values.tolist()
+                continue
+            lengths = array.array("I")
+            lengths.frombytes(raw[:4 * row_count])
+            if sys.byteorder == "big":
+                lengths.byteswap()
+            values = []
+            offset = 4 * row_count
+            for length in lengths:
+                values.append(raw[offset:offset + length].decode("utf-8"))
+                offset += length
+            columns[name] = values
+        return columns
+
+    def iter_songs(self):
+        """
+            Yields (artist key, song dict) for every song, one row group in
+            memory at a time.
+        """
+        for row_group in self.header["row_groups"]:
+            columns = self.read_row_group(row_group)
+            for row in range(row_group["rows"]):
+                artist_key = str(columns["artist_id"][row])
+                if columns["extra"][row] != "":
+                    yield artist_key, json.loads(columns["extra"][row])
+                    continue
+                song = {"song_name": columns["song_name"][row],
+                        "song_id": columns["song_id"][row],
+                        "song_note_amt": columns["song_note_amt"][row],
+                        "song_url": columns["song_url"][row]}
+                if columns["date_added"][row] != "":
+                    song["date_added"] = columns["date_added"][row]
+                yield artist_key, song
+
+
+def is_snapshot_column_song(song):
+    """
+        Utils function: True if song fits the snapshot's typed columns,
+        otherwise it's written to the "extra" column as JSON.
+    """
+    if tuple(song) not in (CompactSong.keys, CompactSong.dated_keys):
+        return False
+    for key in ("song_id", "song_note_amt"):
+        value = song[key]
+        if type(value) is not int or \
+                not snapshot_int_range[0] <= value <= snapshot_int_range[1]:
+            return False
+    for key in ("song_name", "song_url", "date_added"):
+        if not isinstance(song.get(key, "x"), str):
+            return False
+    return song.get("date_added") != ""
+
+
+def encode_snapshot_column(kind, values):
+    """
+        Utils function: The uncompressed bytes of one MappingSnapshot column.
+    """
+    if kind == "int":
+        column = array.array("q", values)
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column.tobytes()
+    encoded = [value.encode("utf-8") for value in values]
+    lengths = array.array("I", [len(value) for value in encoded])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    return lengths.tobytes() + b"".join(encoded)
+
+
+def write_mapping_snapshot(mapping_data, snapshot_filename):
+    """
+        Utils function: Writes mapping_data as a MappingSnapshot. The file
+        is written next to snapshot_filename and swapped in with os.replace
+        once it's complete.
+
+        mapping_data can be a CompactMapping, whose songs are turned back
+        into dicts one at a time as they're written.
+
+        Returns (artist count, song count).
+    """
+    if isinstance(mapping_data, CompactMapping):
+        other_data = mapping_data.other
+        songs_to_annotate = mapping_data.get_songs_to_annotate()
+    else:
+        other_data = {key: value for key, value in mapping_data.items()
+                      if key != "songs_to_annotate"}
+        songs_to_annotate = mapping_data["songs_to_annotate"]
+    temp_filename = snapshot_filename + ".tmp"
+    header = {"format": 1, "row_groups": []}
+    song_count = 0
+    with open(temp_filename, "wb") as f:
+        f.write(snapshot_magic)
+
+        def write_block(raw):
+            data = zlib.compress(raw, snapshot_compression_level)
+            block = [f.tell(), len(data)]
+            f.write(data)
+            return block
+
+        header["mapping"] = write_block(json.dumps(other_data).encode(
+            "utf-8"))
+
+        def write_row_group(rows):
+            columns = {}
+            for index, (name, kind) in enumerate(snapshot_columns):
+                columns[name] = write_block(encode_snapshot_column(
+                    kind, [row[index] for row in rows]))
+            header["row_groups"].append({"rows": len(rows),
+                                         "columns": columns})
+
+        rows = []
+        for artist_key, songs in songs_to_annotate.items():
+            for song in songs:
+                if isinstance(song, CompactSong):
+                    song = song.to_dict()
+                if is_snapshot_column_song(song):
+                    rows.append((int(artist_key), song["song_id"],
+                                 song["song_note_amt"], song["song_name"],
+                                 song["song_url"],
+                                 song.get("date_added", ""), ""))
+                else:
+                    rows.append((int(artist_key), 0, 0, "", "", "",
+                                 json.dumps(song)))
+                if len(rows) == snapshot_row_group_size:
+                    write_row_group(rows)
+                    song_count += len(rows)
+                    rows = []
+        if len(rows) > 0:
+            write_row_group(rows)
+            song_count += len(rows)
+
+        header_data = zlib.compress(json.dumps(header).encode("utf-8"),
+                                    snapshot_compression_level)
+        f.write(header_data)
+        f.write(struct.pack("<Q", len(header_data)))
+        f.write(snapshot_magic)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, snapshot_filename)
+    return len(mapping_data["artists"]), song_count
+
+
+def export_mapping_snapshot(snapshot_filename, filename=None):
+    """
+        Utils function: --export. Writes the mapping for filename to
+        snapshot_filename as a MappingSnapshot.
+
+        Returns (artist count, song count) or 1 if an error occurred.
+    """
+    mapping_data = read_artist_song_mapping_file(filename, compact=True)
+    if mapping_data == 1:
+        return 1
+    try:
+        with metrics.stage("mapping_snapshot_write"):
+            counts = write_mapping_snapshot(mapping_data, snapshot_filename)
+    except Exception as e:
+        logger.debug("Error occurred when exporting " +
+                     str(snapshot_filename))
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
+    logger.debug("We exported " + str(counts[0]) + " artists and " +
+                 str(counts[1]) + " songs to " + str(snapshot_filename))
+    return counts
+
+
+def import_mapping_snapshots(snapshot_filenames, filename=None):
+    """
+        Utils function: --import. Merges MappingSnapshots (say from several
+        crawl hosts) into the mapping for filename.
+
+        Songs are de-duplicated by song ID: the mapping's copy of a song
+        wins, then the first snapshot that has it. The mapping is loaded
+        with just its song IDs and each snapshot is read one row group at a
+        time, so neither side's songs are all held as dicts. New artists
+        and aliases are added, and crawl state and annotation coverage are
+        only taken for artists and songs the mapping didn't have.
+
+        Returns a summary dict with "artists", "songs" and "duplicates"
+        counts or 1 if an error occurred.
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    summary = {"artists": 0, "songs": 0, "duplicates": 0}
+    try:
+        store = get_mapping_store(filename)
+        with metrics.stage("mapping_load"):
+            mapping_data, song_ids = store.load_song_ids()
+        mapping_data = MappingData(mapping_data)
+        mapping_data.setdefault("crawl_state", {})
+        mapping_data.setdefault("annotation_coverage", {})
+        for snapshot_filename in snapshot_filenames:
+            with MappingSnapshot(snapshot_filename) as snapshot:
+                snapshot_mapping = snapshot.read_mapping()
+                names_index, artist_entries = get_artist_index(mapping_data)
+                for artist in snapshot_mapping.get("artists", []):
+                    if artist["ID"] not in artist_entries:
+                        summary["artists"] += 1
+                        add_to_artist_mapping(artist["ID"],
+                                              artist["names"][0],
+                                              mapping_data, filename)
+                    for name in artist["names"]:
+                        register_artist_alias(artist["ID"], name,
+                                              mapping_data, filename)
+                for artist_key, crawl_state in snapshot_mapping.get(
+                        "crawl_state", {}).items():
+                    if artist_key not in mapping_data["crawl_state"]:
+                        update_crawl_state(artist_key, crawl_state,
+                                           mapping_data, filename)
+                snapshot_coverage = snapshot_mapping.get(
+                    "annotation_coverage", {})
+
+                new_songs = {}
+                new_coverage = {}
+
+                def save_new_songs():
+                    with store.deferred():
+                        for artist_key, songs in new_songs.items():
+                            store.record_songs(mapping_data, artist_key,
+                                               songs)
+                        if len(new_coverage) > 0:
+                            update_annotation_coverage(
+                                dict(new_coverage), mapping_data, filename)
+                    new_songs.clear()
+                    new_coverage.clear()
+
+                new_song_count = 0
+                for artist_key, song in snapshot.iter_songs():
+                    if song["song_id"] in song_ids:
+                        summary["duplicates"] += 1
+                        continue
+                    song_ids.add(song["song_id"])
+                    new_songs.setdefault(artist_key, []).append(song)
+                    coverage = snapshot_coverage.get(str(song["song_id"]))
+                    if coverage is not None and str(song["song_id"]) not in \
+                            mapping_data["annotation_coverage"]:
+                        new_coverage[str(song["song_id"])] = coverage
+                    new_song_count += 1
+                    if new_song_count % snapshot_row_group_size == 0:
+                        save_new_songs()
+                save_new_songs()
+                summary["songs"] += new_song_count
+    except Exception as e:
+        logger.debug("Error occurred when importing " +
+                     str(snapshot_filenames))
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
+    logger.debug("Snapshot import summary: " + str(summary))
+    return summary
 
 
 def add_to_artist_mapping(artist_id=None, artist_name=None, mapping_data=None,
                           filename=None):
     """
         Utils function: It adds a new artist name / ID to the mapping data and
-        saves the data as filename. In the future we'll enable users
-        to save the file as whatever filename they want.
+        saves the data as filename. If we already have the artist ID the name
+        is registered as another alias instead of a duplicate artist entry.
     """
     if filename is None:
         logger.debug("No filename was passed to add_to_artist_mapping.")
         logger.debug("We will use the default filename name.")
-        filename = "artist_song_id_mapping.json"
+        filename = default_mapping_filename
+
+    names_index, artist_entries = get_artist_index(mapping_data)
+    if artist_id in artist_entries:
+        logger.debug("We already know this artist ID. Adding an alias.")
+        return register_artist_alias(artist_id, artist_name, mapping_data,
+                                     filename) == 0
 
     artist_to_save = {"names": [artist_name], "ID": artist_id}
     mapping_data["artists"].append(artist_to_save)
     logger.debug("We have added the artist to the mapping data.")
+    artist_entries[artist_id] = artist_to_save
+    names_index.setdefault(normalize_artist_name(artist_name), artist_id)
+    if isinstance(mapping_data, MappingData):
+        mapping_data.artist_index = (mapping_data["artists"],
+                                     len(mapping_data["artists"]),
+                                     names_index, artist_entries)
 
-    with open(filename, 'w') as f:
-        json.dump(mapping_data, f)
+    get_mapping_store(filename).record_artist(mapping_data, artist_id,
+                                              [artist_name])
 
     logger.debug("Okay it looks like everything went good. Returning True")
     return True
 
 
+def register_artist_alias(artist_id=None, alias=None, mapping_data=None,
+                          filename=None):
+    """
+        Utils function: Adds another name for an artist ID we already have
+        in our mapping.
+
+        Returns 0 on success or 1 if we don't know the artist ID.
+    """
+    if artist_id is None or alias is None or mapping_data is None:
+        logger.debug("register_artist_alias was not passed the proper "
+                     "parameters.")
+        return 1
+    names_index, artist_entries = get_artist_index(mapping_data)
+    artist = artist_entries.get(artist_id)
+    if artist is None:
+        logger.debug("We don't have artist ID " + str(artist_id) +
+                     " in our mapping.")
+        return 1
+    if alias not in artist["names"]:
+        artist["names"].append(alias)
+        get_mapping_store(filename).record_artist(mapping_data, artist_id,
+                                                  [alias])
+    names_index.setdefault(normalize_artist_name(alias), artist_id)
+    logger.debug("Registered " + str(alias) + " for artist ID " +
+                 str(artist_id))
+    return 0
+
+
 def add_to_songs_mapping(artist_id=None, song_mapping=None, mapping_data=None,
                          filename=None):
     """
         Utils function: It adds newly research songs to the mapping data and
-        saves the data as a filename. In the future we'll enable
-        users to save the file a whatever filename they want.
+        saves the data as a filename. Songs we already have are matched by
+        song_id through the artist's song index, and updated in place if
+        their details changed.
+
+        Returns a summary dict with "added", "already_present" and "updated"
+        counts.
     """
 
     if filename is None:
         logger.debug("No filename was passed to add_to_artist_mapping.")
         logger.debug("Using the default name.")
-        filename = "artist_song_id_mapping.json"
+        filename = default_mapping_filename
+
+    artist_key = str(artist_id)
+    if artist_key not in mapping_data["songs_to_annotate"]:
+        # The artist ID doesn't exist. Add it and then add the songs
+        mapping_data["songs_to_annotate"][artist_key] = []
+    artist_songs = mapping_data["songs_to_annotate"][artist_key]
+    song_index = get_song_index(mapping_data, artist_key)
 
+    query_index = None
+    if isinstance(mapping_data, MappingData):
+        query_index = mapping_data.query_index
+    date_added = datetime.date.today().isoformat()
+
+    summary = {"added": 0, "already_present": 0, "updated": 0}
+    changed_songs = []
     for song in song_mapping:
-        if str(artist_id) in mapping_data["songs_to_annotate"].keys():
-            need_to_add_song = True
-            for old_song in mapping_data["songs_to_annotate"][str(artist_id)]:
-                if old_song["song_id"] == song["song_id"]:
-                    need_to_add_song = False
-            if need_to_add_song is True:
-                logger.debug("Addding a new song to mapping!")
-                mapping_data["songs_to_annotate"][str(artist_id)].append(song)
+        old_song = song_index.get(song["song_id"])
+        if old_song is None:
+            logger.debug("Addding a new song to mapping!")
+            song.setdefault("date_added", date_added)
+            artist_songs.append(song)
+            song_index[song["song_id"]] = song
+            changed_songs.append(song)
+            summary["added"] += 1
+        elif any(old_song.get(key) != value for key, value in song.items()):
+            old_song.update(song)
+            changed_songs.append(old_song)
+            summary["updated"] += 1
         else:
-            # The artist ID doesn't exist. Add it and then add the song
-            mapping_data["songs_to_annotate"][str(artist_id)] = []
-            mapping_data["songs_to_annotate"][str(artist_id)].append(song)
+            summary["already_present"] += 1
+            continue
+        if query_index is not None:
+            query_index.add(artist_key, song_index[song["song_id"]])
+    if query_index is not None:
+        query_index.note_added(artist_key, artist_songs)
 
-    # Save the JSON file
-    with open(filename, 'w') as f:
-        json.dump(mapping_data, f)
+    if len(changed_songs) > 0:
+        get_mapping_store(filename).record_songs(mapping_data, artist_id,
+                                                 changed_songs)
 
-    logger.debug("Okay it looks like everything went good. Returning True")
-    return True
+    logger.debug("Song mapping summary for artist " + artist_key + ": " +
+                 str(summary))
+    return summary
+
+
+def update_crawl_state(artist_id=None, crawl_state=None, mapping_data=None,
+                       filename=None):
+    """
+        Utils function: Saves an artist's crawl state (see
+        iter_artist_songs_to_annotate( )) in mapping_data["crawl_state"].
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    mapping_data.setdefault("crawl_state", {})[str(artist_id)] = crawl_state
+    get_mapping_store(filename).record_crawl_state(mapping_data, artist_id,
+                                                   crawl_state)
+    return 0
+
+
+def update_annotation_coverage(coverage=None, mapping_data=None,
+                               filename=None):
+    """
+        Utils function: Saves song ID -> coverage summaries (see
+        get_song_annotation_coverage( )) in
+        mapping_data["annotation_coverage"].
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    mapping_data.setdefault("annotation_coverage", {}).update(coverage)
+    get_mapping_store(filename).record_annotation_coverage(mapping_data,
+                                                           coverage)
+    return 0
+
+
+def normalize_artist_name(artist_name):
+    """
+        Utils function: Case, whitespace and unicode normalizes an artist name
+        so "  BEYONCÉ" and "Beyoncé" are the same key.
+    """
+    artist_name = unicodedata.normalize("NFKC", str(artist_name)).casefold()
+    return " ".join(artist_name.split())
+
+
+def get_artist_index(mapping_data):
+    """
+        Utils function: Returns (normalized name -> artist ID, artist ID ->
+        artist entry) for mapping_data["artists"].
+
+        MappingData keeps the index between calls and rebuilds it when the
+        artists list was replaced or changed size behind its back.
+    """
+    artists = mapping_data["artists"]
+    if isinstance(mapping_data, MappingData):
+        cached = mapping_data.artist_index
+        if cached is not None and cached[0] is artists and \
+                cached[1] == len(artists):
+            return cached[2], cached[3]
+    names_index = {}
+    artist_entries = {}
+    for artist in artists:
+        artist_entries.setdefault(artist["ID"], artist)
+        for name in artist["names"]:
+            names_index.setdefault(normalize_artist_name(name), artist["ID"])
+    if isinstance(mapping_data, MappingData):
+        mapping_data.artist_index = (artists, len(artists), names_index,
+                                     artist_entries)
+    return names_index, artist_entries
+
+
+def get_song_index(mapping_data, artist_key):
+    """
+        Utils function: Returns the song_id -> song dict index for an
+        artist's songs_to_annotate list.
+
+        MappingData keeps these indexes between calls and rebuilds one when
+        the artist's list was replaced or changed size behind its back.
+    """
+    artist_songs = mapping_data["songs_to_annotate"][artist_key]
+    if not isinstance(mapping_data, MappingData):
+        return {song["song_id"]: song for song in artist_songs}
+    cached = mapping_data.song_indexes.get(artist_key)
+    if cached is not None and cached[0] is artist_songs and \
+            len(cached[1]) == len(artist_songs):
+        return cached[1]
+    song_index = {song["song_id"]: song for song in artist_songs}
+    mapping_data.song_indexes[artist_key] = (artist_songs, song_index)
+    return song_index
+
+
+class SongQueryIndex:
+    """
+        Inverted index over every song in songs_to_annotate for --query.
+
+        Titles are case and unicode normalized, then indexed by word (for
+        text queries) and, once a substring query needs them, by character
+        trigram. Postings are arrays of entry numbers into entries, which
+        holds (artist key, song dict). The annotation counts and dates we
+        filter on are kept in columns next to it, and the order of every
+        entry by each sort key is worked out once and kept until songs
+        change.
+
+        add_to_songs_mapping( ) adds songs as it goes and sync( ) re-indexes
+        only the artists whose song list was replaced or changed size behind
+        our back, like get_song_index( ) does.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.titles = []
+        self.song_note_amts = []
+        self.dates_added = []
+        self.positions = {}
+        self.artists = {}
+        self.word_postings = {}
+        self.trigram_postings = None
+        self.orders = {}
+        self.removed_count = 0
+
+    @staticmethod
+    def normalize_title(title):
+        return unicodedata.normalize("NFKC", str(title)).casefold()
+
+    @staticmethod
+    def get_trigrams(title):
+        return {title[i:i + 3] for i in range(len(title) - 2)}
+
+    def live_count(self):
+        return len(self.entries) - self.removed_count
+
+    def add(self, artist_key, song):
+        """
+            Indexes song, or re-indexes it if we already have it. Songs
+            whose title didn't change keep their entry.
+        """
+        title = self.normalize_title(song.get("song_name", ""))
+        self.orders = {}
+        position = self.positions.get((artist_key, song["song_id"]))
+        if position is not None:
+            if self.titles[position] == title and \
+                    self.entries[position][1] is song:
+                self.song_note_amts[position] = song.get("song_note_amt") or 0
+                self.dates_added[position] = song.get("date_added")
+                return
+            self.remove_position(position)
+        position = len(self.entries)
+        self.entries.append((artist_key, song))
+        self.titles.append(title)
+        self.song_note_amts.append(song.get("song_note_amt") or 0)
+        self.dates_added.append(song.get("date_added"))
+        self.positions[(artist_key, song["song_id"])] = position
+        for word in set(re.findall(r"\w+", title)):
+            self.word_postings.setdefault(word, array.array("i")).append(
+                position)
+        if self.trigram_postings is not None:
+            for trigram in self.get_trigrams(title):
+                self.trigram_postings.setdefault(
+                    trigram, array.array("i")).append(position)
+        self.artists.setdefault(
+            artist_key, [None, 0, array.array("i")])[2].append(position)
+
+    def remove_position(self, position):
+        """
+            Drops an entry. Its number stays in the postings and is skipped
+            when we look candidates up.
+        """
+        artist_key, song = self.entries[position]
+        self.entries[position] = None
+        self.titles[position] = None
+        self.positions.pop((artist_key, song["song_id"]), None)
+        self.orders = {}
+        self.removed_count += 1
+
+    def remove_artist(self, artist_key):
+        artist = self.artists.pop(artist_key, None)
+        if artist is None:
+            return
+        for position in artist[2]:
+            if self.entries[position] is not None:
+                self.remove_position(position)
+
+    def sync(self, mapping_data):
+        """
+            Brings the index up to date with mapping_data, a loaded
+            mapping or a CompactMapping.
+        """
+        if isinstance(mapping_data, CompactMapping):
+            songs_to_annotate = mapping_data.get_songs_to_annotate()
+        else:
+            songs_to_annotate = mapping_data["songs_to_annotate"]
+        for artist_key in list(self.artists):
+            if artist_key not in songs_to_annotate:
+                self.remove_artist(artist_key)
+        for artist_key, artist_songs in songs_to_annotate.items():
+            artist = self.artists.get(artist_key)
+            if artist is not None and artist[0] is artist_songs and \
+                    artist[1] == len(artist_songs):
+                continue
+            if artist is not None and artist[0] is artist_songs and \
+                    artist[1] < len(artist_songs):
+                # Songs were appended, index just those.
+                for song in artist_songs[artist[1]:]:
+                    self.add(artist_key, song)
+                artist[1] = len(artist_songs)
+                continue
+            self.remove_artist(artist_key)
+            for song in artist_songs:
+                self.add(artist_key, song)
+            self.artists.setdefault(artist_key,
+                                    [None, 0, array.array("i")])[:2] = \
+                [artist_songs, len(artist_songs)]
+        # Start over once most of what we indexed was dropped since.
+        if self.removed_count > 1000 and \
+                self.removed_count * 2 > len(self.entries):
+            self.__init__()
+            self.sync(mapping_data)
+
+    def note_added(self, artist_key, artist_songs):
+        """
+            Called after add_to_songs_mapping( ) appended songs it already
+            gave to add( ), so sync( ) doesn't index them again.
+        """
+        artist = self.artists.get(artist_key)
+        if artist is not None and (artist[0] is None or
+                                   artist[0] is artist_songs):
+            artist[:2] = [artist_songs, len(artist_songs)]
+
+    def intersect(self, postings_lists):
+        """
+            Entry numbers that are in every one of postings_lists, smallest
+            list first.
+        """
+        postings_lists = sorted(postings_lists, key=len)
+        if len(postings_lists) == 0:
+            return None
+        positions = set(postings_lists[0])
+        for postings in postings_lists[1:]:
+            if len(positions) == 0:
+                break
+            positions.intersection_update(postings)
+        return positions
+
+    def search(self, text=None, substring=None):
+        """
+            Entry numbers of the songs whose title has every word of text
+            and contains substring. None means every song matches.
+        """
+        positions = None
+        if text is not None:
+            words = set(re.findall(r"\w+", self.normalize_title(text)))
+            positions = self.intersect([self.word_postings.get(word, ())
+                                        for word in words])
+        if substring is not None:
+            substring = self.normalize_title(substring)
+            trigrams = self.get_trigrams(substring)
+            candidates = None
+            if len(trigrams) > 0:
+                if self.trigram_postings is None:
+                    self.trigram_postings = {}
+                    for position, title in enumerate(self.titles):
+                        if title is None:
+                            continue
+                        for trigram in self.get_trigrams(title):
+                            self.trigram_postings.setdefault(
+                                trigram, array.array("i")).append(position)
+                candidates = self.intersect(
+                    [self.trigram_postings.get(trigram, ())
+                     for trigram in trigrams])
+            if candidates is None:
+                candidates = range(len(self.titles))
+            if positions is not None:
+                candidates = positions.intersection(candidates)
+            # Trigrams only narrow it down, check the actual titles.
+            positions = {position for position in candidates
+                         if self.titles[position] is not None and
+                         substring in self.titles[position]}
+        if positions is None:
+            return None
+        return {position for position in positions
+                if self.entries[position] is not None}
+
+    def get_sort_key(self, sort_by, artist_names):
+        """
+            Returns a function giving an entry number's sort key. Ties go by
+            entry number so every query sorts the same way.
+        """
+        entries = self.entries
+        if sort_by == "song_name":
+            titles = self.titles
+            return lambda position: (titles[position], position)
+        if sort_by == "song_id":
+            return lambda position: (entries[position][1]["song_id"],
+                                     position)
+        if sort_by == "annotations":
+            song_note_amts = self.song_note_amts
+            return lambda position: (song_note_amts[position], position)
+        if sort_by == "date_added":
+            dates_added = self.dates_added
+            return lambda position: (dates_added[position] or "", position)
+        if sort_by == "artist":
+            artist_names = {
+                artist_key: normalize_artist_name(artist_name or "")
+                for artist_key, artist_name in artist_names.items()}
+            return lambda position: (artist_names[entries[position][0]],
+                                     position)
+        raise ValueError("Can't sort by " + str(sort_by))
+
+    def get_order(self, sort_by, artist_names):
+        """
+            Every live entry number, sorted by sort_by.
+        """
+        if sort_by not in self.orders:
+            self.orders[sort_by] = sorted(
+                (position for position, entry in enumerate(self.entries)
+                 if entry is not None),
+                key=self.get_sort_key(sort_by, artist_names))
+        return self.orders[sort_by]
+
+
+def get_query_index(mapping_data):
+    """
+        Utils function: Returns the SongQueryIndex for mapping_data, up to
+        date with its songs_to_annotate.
+
+        MappingData keeps the index between calls, so only the first query
+        pays for building it.
+    """
+    if not isinstance(mapping_data, MappingData):
+        query_index = SongQueryIndex()
+        query_index.sync(mapping_data)
+        return query_index
+    if mapping_data.query_index is None:
+        mapping_data.query_index = SongQueryIndex()
+    mapping_data.query_index.sync(mapping_data)
+    return mapping_data.query_index
 
 
 def get_annotation_information(annotation_id=None):
@@ -80,18 +2628,15 @@ def get_annotation_information(annotation_id=None):
         logger.debug("get_annotation_information was not passed the correct ",
                      "parameters. We're going to use known song annotation ID")
         annotation_id = "3490604"
-    search_url = base_url + "annotations/" + str(annotation_id)
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
-        logger.debug("The search call was successful!\n")
-        answer = r.text
-        return answer
-    else:
+    try:
+        r = request_genius("annotations/" + str(annotation_id))
+    except GeniusAPIError as e:
         logger.debug("The call was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
+        logger.debug(str(e))
         return 1
+    logger.debug("The search call was successful!\n")
+    answer = r.text
+    return answer
 
 
 def get_song_information(song_id=None):
@@ -102,91 +2647,269 @@ def get_song_information(song_id=None):
     """
     if song_id is None:
         logger.debug("get_song_information was not passed correct parameters.")
-        logger.deubg("We are using song ID for a Gorillaz's song as default.")
+        logger.debug("We are using song ID for a Gorillaz's song as default.")
         song_id = "860"
 
-    search_url = base_url + "songs/" + str(song_id)
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
-        logger.debug("The call to artists/:id was successful!\n")
-        answer = r.json()
-        return answer
-    else:
+    try:
+        answer = request_genius_json("songs/" + str(song_id))
+    except GeniusAPIError as e:
         logger.debug("The call was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
+        logger.debug(str(e))
         return 1
+    logger.debug("The call to songs/:id was successful!\n")
+    return answer
 
 
-def get_the_next_page_of_artist_songs(next_page, artist_id):
+def get_the_next_page_of_artist_songs(next_page, artist_id, sort=None):
     """
         Worker function for get_artist_songs_genius( )
 
-        Function recursively calls the artists/:id/songs Genius API endpoint.
+        Function calls the artists/:id/songs Genius API endpoint for a single
+        page. get_artist_songs_genius( ) runs several of these at once.
 
-        It returns song results for each call and raises an Exception
-        if there's an issue.
+        It returns the "response" body for the page and raises a
+        GeniusAPIError if there's an issue.
     """
-    search_url = base_url + "artists/" + str(artist_id) + "/songs?page=" + \
-                            str(next_page)
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
-        yes_msg = "Recursive call to get more of artist's songs was success!\n"
-        logger.debug(yes_msg)
-        results = r.json()
-        song_ids = []
-        if "next_page" in results["response"]:
-            if results["response"]["next_page"] is not None:
-                # Recursive hell to collect all the songs.
-                next_page = results["response"]["next_page"]
-                songs_to_add = get_the_next_page_of_artist_songs(next_page,
-                                                                 artist_id)
-                song_ids = results["response"]["songs"]
-                song_ids = song_ids + songs_to_add
-                return song_ids
-            else:
-                song_ids = results["response"]["songs"]
-                return song_ids
-    else:
-        logger.debug("The call was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
-        raise Exception("Exception in get_the_next_page_of_artist_songs()")
+    params = {"page": next_page, "per_page": songs_per_page}
+    if sort is not None:
+        params["sort"] = sort
+    results = get_json_codec().loads_artist_songs_page(request_genius(
+        "artists/" + str(artist_id) + "/songs", params).content)
+    logger.debug("The call to get page " + str(next_page) +
+                 " of the artist's songs was a success!\n")
+    return results["response"]
+
+
+def get_the_next_page_of_song_referents(next_page, song_id):
+    """
+        Wrapper for the /referents?song_id= Genius API endpoint. Each
+        referent comes with its annotations, so one page covers up to
+        referents_per_page annotated fragments without fetching
+        annotations/:id for each of them.
+
+        Returns the "response" part of one page. Raises GeniusAPIError.
+    """
+    results = request_genius_json("referents", {
+        "song_id": song_id, "page": next_page,
+        "per_page": referents_per_page, "text_format": "plain"})
+    return results["response"]
 
 
-def get_artist_songs_genius(artist_id=None):
+def get_artist_songs_genius(artist_id=None, sort=None):
     """
         Wrapper for the /artists/:id/songs Genius API endpoint
 
-        Returns songs for a given artist ID or 1 if an error occurred.
+        Returns songs for a given artist ID (in page order) or 1 if an
+        error occurred. Use iter_artist_song_pages( ) to avoid holding the
+        whole discography in memory.
     """
     if artist_id is None:
         logger.debug("get_artist_song_genius was not passed correct params.")
         logger.debug("We are going to use the artist ID of the Gorillaz. 860.")
         artist_id = "860"
-    search_url = base_url + "artists/" + str(artist_id) + "/songs"
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
-        logger.debug("The call to artists/id/songs was successful!\n")
-        results = r.json()
-        song_ids = []
-        if "next_page" in results["response"]:
-            logger.debug("Recursively trying to get all of artist's songs.\n")
-            # Start the recursion to get all the songs
-            next_page = results["response"]["next_page"]
-            songs_to_add = get_the_next_page_of_artist_songs(next_page,
-                                                             artist_id)
-            # set song_ids to our initial results + the recursion results.
-            song_ids = results["response"]["songs"] + songs_to_add
-            return song_ids
-    else:
-        logger.debug("The call was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
+    song_ids = []
+    try:
+        for songs in iter_artist_song_pages(artist_id, sort):
+            song_ids.extend(songs)
+    except (GeniusAPIError, ValueError, KeyError) as e:
+        logger.debug("We hit an error while paging artist's songs.")
+        logger.debug("The error that occurred is: " + str(e))
         return 1
+    logger.debug("We collected " + str(len(song_ids)) + " songs.")
+    return song_ids
+
+
+class ArtistSongPager:
+    """
+        The artists/:id/songs paging rules iter_artist_song_pages( ) and
+        AsyncGeniusClient.get_artist_songs_genius( ) share.
+
+        prefetch (page_workers by default) pages are requested up front and
+        one more each time a page is read, so that many are in flight while
+        we wait on the current one. Paging stops at the first page that is
+        empty or has no next_page, or after the page stop_when (called with
+        each page's songs) returns True for.
+    """
+
+    def __init__(self, stop_when=None, prefetch=None):
+        if prefetch is None:
+            prefetch = page_workers
+        self.stop_when = stop_when
+        self.prefetch = prefetch
+        self.next_page = 1
+        self.done = False
+
+    def first_pages(self):
+        """
+            The page numbers to request before reading any of them.
+        """
+        pages = list(range(self.next_page, self.next_page + self.prefetch))
+        self.next_page += self.prefetch
+        return pages
+
+    def read_page(self, results):
+        """
+            Reads the "response" of the next page in page order. Returns its
+            songs and the page number to request next, None once we're done.
+        """
+        songs = results.get("songs") or []
+        if len(songs) == 0 or results.get("next_page") is None:
+            logger.debug("We reached the last page of artist's songs.")
+            self.done = True
+        elif self.stop_when is not None and self.stop_when(songs) is True:
+            logger.debug("We reached songs we've already seen.")
+            self.done = True
+        if self.done is True:
+            return songs, None
+        self.next_page += 1
+        return songs, self.next_page - 1
+
+
+def iter_artist_song_pages(artist_id, sort=None, stop_when=None,
+                           prefetch=None):
+    """
+        Generator that yields an artist's songs one page at a time, in page
+        order, as the pages come in.
+
+        Pages are fetched by a pool of prefetch (page_workers by default)
+        threads following the ArtistSongPager rules: the next few pages are
+        requested while we wait on the current one and paging stops at the
+        last page or once stop_when returns True.
+
+        Raises GeniusAPIError if a page can't be fetched.
+    """
+    pager = ArtistSongPager(stop_when, prefetch)
+    pending_pages = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=pager.prefetch) as pool:
+        try:
+            for page in pager.first_pages():
+                pending_pages.append(pool.submit(
+                    get_the_next_page_of_artist_songs, page, artist_id,
+                    sort))
+            while pending_pages:
+                songs, page = pager.read_page(
+                    pending_pages.popleft().result())
+                if len(songs) > 0:
+                    yield songs
+                if page is None:
+                    break
+                pending_pages.append(pool.submit(
+                    get_the_next_page_of_artist_songs, page, artist_id,
+                    sort))
+        finally:
+            for future in pending_pages:
+                future.cancel()
+
+
+def iter_artist_songs_to_annotate(artist_id, crawl_state=None,
+                                  incremental=False, new_crawl_state=None):
+    """
+        Generator for a crawl of an artist's songs. Each page is filtered
+        with get_list_of_low_popularity_artist_songs( ) as soon as it
+        arrives and only the compact song records are yielded (one list per
+        page), so memory stays flat however big the discography is.
+
+        With incremental=True and a full crawl in crawl_state newer than
+        full_crawl_interval, we page with incremental_sort (newest release
+        first) and stop once incremental_stop_pages pages in a row have no
+        song released after the high water release date. Song IDs
+        follow when a song was added to Genius, not when it was released,
+        so songs on the pages we read are new if they have a higher ID than
+        the high water song ID or a later release date. Old releases added
+        since the last crawl sit deep in that order and are only picked up
+        by the next full crawl. Pages are fetched one at a time then since
+        we usually need just one.
+
+        With top_songs_count set the pages are scored into a TopSongs heap
+        instead and the best songs are yielded once at the end.
+
+        When the crawl is done new_crawl_state (if given) is filled with
+        the artist's new crawl state: last crawl time, last full crawl time,
+        song count, songs seen, high water song ID and release date (never
+        later than today) and page count.
+
+        Raises GeniusAPIError if a page can't be fetched.
+    """
+    now = time.time()
+    today = datetime.date.today().isoformat()
+    full_crawl = True
+    # Crawl states from before we kept the high water release date get a
+    # full crawl to record it.
+    if incremental is True and crawl_state is not None and \
+            now - crawl_state.get("last_full_crawl", 0) < full_crawl_interval \
+            and "high_water_release_date" in crawl_state:
+        full_crawl = False
+
+    high_water = 0
+    high_water_date = ""
+    stale_pages = [0]
+
+    def is_past_new_songs(songs):
+        if any((get_song_release_date(song) or "") > high_water_date
+               for song in songs):
+            stale_pages[0] = 0
+            return False
+        stale_pages[0] += 1
+        return stale_pages[0] >= incremental_stop_pages
+
+    if full_crawl is True:
+        logger.debug("Doing a full crawl of artist " + str(artist_id))
+        stop_when = None
+        sort = None
+        prefetch = None
+    else:
+        logger.debug("Doing an incremental crawl of artist " + str(artist_id))
+        high_water = crawl_state.get("high_water_song_id", 0)
+        high_water_date = crawl_state["high_water_release_date"]
+        stop_when = is_past_new_songs
+        sort = incremental_sort
+        prefetch = 1
+
+    page_count = 0
+    songs_seen = 0
+    new_high_water = high_water
+    new_high_water_date = high_water_date
+    top_songs = None
+    if top_songs_count is not None:
+        top_songs = TopSongs(top_songs_count)
+    for songs in iter_artist_song_pages(artist_id, sort, stop_when,
+                                        prefetch):
+        page_count += 1
+        release_dates = [get_song_release_date(song) or "" for song in songs]
+        new_high_water_date = max(new_high_water_date,
+                                  min(max(release_dates), today))
+        if full_crawl is False:
+            songs = [song for song, release_date in zip(songs, release_dates)
+                     if song["id"] > high_water or
+                     release_date > high_water_date]
+        if len(songs) == 0:
+            continue
+        songs_seen += len(songs)
+        new_high_water = max(new_high_water,
+                             max(song["id"] for song in songs))
+        if top_songs is None:
+            yield get_list_of_low_popularity_artist_songs(songs, artist_id)
+        else:
+            top_songs.extend(*score_artist_songs(songs, artist_id))
+    if top_songs is not None:
+        yield top_songs.songs()
+
+    if new_crawl_state is not None:
+        new_crawl_state["last_crawl"] = now
+        new_crawl_state["page_count"] = page_count
+        new_crawl_state["songs_seen"] = songs_seen
+        new_crawl_state["high_water_song_id"] = new_high_water
+        new_crawl_state["high_water_release_date"] = new_high_water_date
+        if full_crawl is True:
+            new_crawl_state["last_full_crawl"] = now
+            new_crawl_state["song_count"] = songs_seen
+        else:
+            new_crawl_state["last_full_crawl"] = crawl_state["last_full_crawl"]
+            new_crawl_state["song_count"] = crawl_state.get("song_count",
+                                                            0) + songs_seen
+        logger.debug("New crawl state for artist " + str(artist_id) + ": " +
+                     str(new_crawl_state))
 
 
 def get_artist_data_genius(artist_id=None):
@@ -198,113 +2921,413 @@ def get_artist_data_genius(artist_id=None):
     logger.debug("get_artist_data_genius() started!\n")
     if artist_id is None:
         artist_id = "860"
-    search_url = base_url + "artists/" + str(artist_id)
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
-        logger.debug("The search call was successful!\n")
-        logger.debug("Returning now!\n")
-        answer = r.text
-        return answer
-    else:
+    try:
+        r = request_genius("artists/" + str(artist_id))
+    except GeniusAPIError as e:
         logger.debug("The call was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
+        logger.debug(str(e))
         return 1
+    logger.debug("The search call was successful!\n")
+    logger.debug("Returning now!\n")
+    answer = r.text
+    return answer
 
 
 def get_list_of_low_popularity_artist_songs(list_of_songs_data=None,
-                                            artist_id=None):
+                                            artist_id=None, top=None):
     """Takes a list of Genius API song objects and returns a list of
        low popularity song objects.
+
+       Songs are kept if the artist is the primary artist and they have
+       between min_annotations and max_annotations annotations. With top set
+       only the top best scoring songs are returned, best first.
     """
     if list_of_songs_data is None or artist_id is None:
         logger.debug("get_list_of_low_popularity_artist_songs was not passed",
                      " the proper parameters.")
         logger.debug("Returning 1.")
         return 1
-    answer = []
-    low_pop_count = [0]
-    for song_data in list_of_songs_data:
-        if song_data["annotation_count"] in low_pop_count:
+    answer, scores = score_artist_songs(list_of_songs_data, artist_id)
+    if top is not None:
+        top_songs = TopSongs(top)
+        top_songs.extend(answer, scores)
+        answer = top_songs.songs()
+    return answer
+
+
+def score_artist_songs(list_of_songs_data, artist_id):
+    """
+        Utils function: Filters Genius API song objects down to low
+        popularity songs by artist_id and scores them.
+
+        Returns (list of compact song records, list of their scores).
+    """
+    with metrics.stage("filtering"):
+        answer = []
+        scores = []
+        now = time.time()
+        artist_id = int(artist_id)
+        for song_data in list_of_songs_data:
+            annotation_count = song_data["annotation_count"]
+            if annotation_count < min_annotations or \
+                    annotation_count > max_annotations:
+                continue
             # Check to prevent including songs where the aritst was a producer.
-            if song_data["primary_artist"]["id"] == artist_id:
-                relevant_info = {}
-                relevant_info["song_name"] = song_data["title"]
-                relevant_info["song_id"] = song_data["id"]
-                relevant_info["song_note_amt"] = song_data["annotation_count"]
-                relevant_info["song_url"] = song_data["url"]
-                answer.append(relevant_info)
+            if song_data["primary_artist"]["id"] != artist_id:
+                continue
+            stats = song_data.get("stats") or {}
+            score = score_weights["annotations"] * -annotation_count + \
+                score_weights["pageviews"] * \
+                math.log1p(stats.get("pageviews") or 0) + \
+                score_weights["hot"] * (1 if stats.get("hot") else 0) + \
+                score_weights["recency"] * get_song_recency(song_data, now)
+            answer.append(get_song_record(song_data))
+            scores.append(score)
+        return answer, scores
+
+
+def get_song_record(song_data):
+    """
+        Utils function: Turns a Genius API song object into the compact
+        record we keep in songs_to_annotate.
+    """
+    relevant_info = {}
+    relevant_info["song_name"] = song_data["title"]
+    relevant_info["song_id"] = song_data["id"]
+    relevant_info["song_note_amt"] = song_data["annotation_count"]
+    relevant_info["song_url"] = song_data["url"]
+    return relevant_info
+
+
+def get_song_release_day(song_data):
+    """
+        Utils function: A Genius API song's release date as a datetime.date
+        (missing month / day count as 1), None if it doesn't have one.
+    """
+    release_date = song_data.get("release_date_components") or {}
+    if not release_date.get("year"):
+        return None
+    try:
+        return datetime.date(release_date["year"],
+                             release_date.get("month") or 1,
+                             release_date.get("day") or 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_song_release_date(song_data):
+    """
+        Utils function: get_song_release_day( ) as a YYYY-MM-DD string.
+    """
+    release_day = get_song_release_day(song_data)
+    if release_day is None:
+        return None
+    return release_day.isoformat()
+
+
+unix_epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+
+
+def get_song_recency(song_data, now):
+    """
+        Utils function: 1 for a song released today (UTC), falling towards 0
+        the older it is. Songs without a release date get 0.
+    """
+    release_day = get_song_release_day(song_data)
+    if release_day is None:
+        return 0.0
+    released_at = (release_day.toordinal() - unix_epoch_ordinal) * 86400.0
+    age_in_years = (now - released_at) / (365.25 * 24 * 3600)
+    return 1.0 / (1.0 + max(0.0, age_in_years))
+
+
+class TopSongs:
+    """
+        Keeps the N best scoring songs seen so far in a min heap, so we
+        never sort everything we've seen.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.heap = []
+        self.pushed = 0
+
+    def extend(self, songs, scores):
+        for song, score in zip(songs, scores):
+            # pushed breaks ties so we never compare the song dicts.
+            entry = (score, -self.pushed, song)
+            self.pushed += 1
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, entry)
+            elif entry > self.heap[0]:
+                heapq.heapreplace(self.heap, entry)
+
+    def songs(self):
+        return [entry[2] for entry in sorted(self.heap, reverse=True)]
+
+
+# Every primary artist we've seen in a /search hit, normalized name ->
+# (artist ID, name as Genius spells it). Filled by harvest_search_hits( ) so
+# resolving a name another search already turned up costs no API call.
+harvested_artists = {}
+harvested_artists_lock = threading.Lock()
+
+
+def harvest_search_hits(hits):
+    """
+        Utils function: Adds the primary artist of every /search hit to
+        harvested_artists.
+
+        Returns the normalized name -> (artist ID, name) dict for these hits.
+    """
+    answer = {}
+    for hit in hits:
+        primary_artist = (hit.get("result") or {}).get("primary_artist")
+        if not primary_artist or "id" not in primary_artist or \
+                not primary_artist.get("name"):
+            continue
+        answer.setdefault(normalize_artist_name(primary_artist["name"]),
+                          (primary_artist["id"], primary_artist["name"]))
+    with harvested_artists_lock:
+        for normalized_name, artist in answer.items():
+            harvested_artists.setdefault(normalized_name, artist)
     return answer
 
 
+def get_harvested_artist_id(normalized_name):
+    """
+        Utils function: The artist ID harvest_search_hits( ) saw for a
+        normalized name, None if we haven't seen it.
+    """
+    with harvested_artists_lock:
+        harvested_artist = harvested_artists.get(normalized_name)
+    if harvested_artist is None:
+        return None
+    logger.debug("We already saw " + str(harvested_artist[1]) + " in an "
+                 "earlier search. The artist ID is: " +
+                 str(harvested_artist[0]))
+    return harvested_artist[0]
+
+
+def get_search_params(query, page=None):
+    """
+        Utils function: The /search params for one page of query's hits.
+    """
+    params = {"q": str(query)}
+    if page is not None and page != 1:
+        params["page"] = page
+    return params
+
+
+def read_artist_search_page(result, normalized_name, seen_artists):
+    """
+        Utils function: Reads one /search response for an artist ID lookup.
+        Every hit's primary artist is harvested and added to seen_artists,
+        for match_artist_name( ) once we run out of pages.
+
+        Returns (number of hits, ID of the artist named normalized_name or
+        None if this page doesn't have them).
+    """
+    hits = result["response"]["hits"]
+    page_artists = harvest_search_hits(hits)
+    for name, artist in page_artists.items():
+        logger.debug("The primary artist for this hit is: " +
+                     str(artist[1]) + "\n")
+        seen_artists.setdefault(name, artist)
+    artist = page_artists.get(normalized_name)
+    if artist is None:
+        return len(hits), None
+    return len(hits), artist[0]
+
+
+def match_artist_name(artist_name, candidates):
+    """
+        Utils function: Finds artist_name in a normalized name -> (artist ID,
+        name) dict. Exact normalized matches win, otherwise the closest name
+        at or above artist_match_cutoff similarity is considered. It's only
+        used when it beats the runner up by artist_match_margin, doesn't
+        differ from artist_name only in its digits ("Maroon 5" isn't
+        "Maroon 6") and accept_fuzzy_matches is set (--accept-fuzzy).
+
+        Returns the artist ID or 1 if nothing matched.
+    """
+    normalized_name = normalize_artist_name(artist_name)
+    if normalized_name in candidates:
+        return candidates[normalized_name][0]
+    ratios = sorted(((difflib.SequenceMatcher(None, normalized_name,
+                                              name).ratio(), name)
+                     for name in candidates), reverse=True)
+    if len(ratios) == 0 or ratios[0][0] < artist_match_cutoff:
+        return 1
+    best_ratio, best_name = ratios[0]
+    best_artist = candidates[best_name]
+    if len(ratios) > 1 and best_ratio - ratios[1][0] < artist_match_margin:
+        logger.info("Can't tell if " + str(artist_name) + " is " +
+                    str(best_artist[1]) + " or " +
+                    str(candidates[ratios[1][1]][1]) + ".")
+        return 1
+    if re.sub(r"\d", "", best_name) == re.sub(r"\d", "", normalized_name):
+        logger.info(str(artist_name) + " and " + str(best_artist[1]) +
+                    " only differ in their numbers, not matching them.")
+        return 1
+    if accept_fuzzy_matches is not True:
+        logger.info("The closest match for " + str(artist_name) + " is " +
+                    str(best_artist[1]) + " (" + str(best_artist[0]) +
+                    "). Re-run with --accept-fuzzy to use it.")
+        return 1
+    logger.info("Using " + str(best_artist[1]) + " (" +
+                str(best_artist[0]) + ") for " + str(artist_name) + ".")
+    return best_artist[0]
+
+
 def get_artist_id(artist_name=None):
     """
         This function tries to determine an artist's ID on
         Genius.com using the /search endpoint.
 
+        Names harvested from earlier searches are checked first. Otherwise we
+        page through up to search_max_pages of hits until a primary artist's
+        name matches, and fall back to the closest fuzzy match among the
+        hits we saw.
+
         It returns a numerical ID for that artist or a 1 if an error occurred.
     """
     if artist_name is None:
         logger.debug("get_artist_id was not passed the proper parameters.\n")
         logger.debug("Returning 1 now")
         return 1
-    result = search_genius(artist_name)
-    if result == 1:
-        logger.debug("An error when trying to get the search response.\n")
-        logger.debug("Returning now!")
-        return 1
-    else:
-        response = result["response"]
-        if len(response["hits"]) == 0:
-            logger.debug("Search result contained no results.")
-            logger.debug("Returning 1")
-            return 1
-        else:
-            hits = response["hits"]
-            for hit in hits:
-                if "result" in hit.keys():
-                    if "primary_artist" in hit["result"].keys():
-                        if "id" in hit["result"]["primary_artist"]:
-                            name = hit["result"]["primary_artist"]["name"]
-                            logger.debug("The primary artist for this hit is: "
-                                         + str(name) + "\n")
-                            if name == artist_name:
-                                return hit["result"]["primary_artist"]["id"]
-                    else:
-                        logger.debug("We could not find any primary",
-                                     " information in the hit['result']",
-                                     " We are continuing onward!")
-                else:
-                    logger.debug("Error: We couldn't find any result key",
-                                 " in the song's information. This is odd.",
-                                 " We are continuing onward!")
-            logger.debug("We do not appear to have found the artist ID ")
-            logger.debug(" with the user's search query!")
-            logger.debug("Returning 1")
+    normalized_name = normalize_artist_name(artist_name)
+    harvested_artist_id = get_harvested_artist_id(normalized_name)
+    if harvested_artist_id is not None:
+        return harvested_artist_id
+    seen_artists = {}
+    for page in range(1, search_max_pages + 1):
+        result = search_genius(artist_name, page)
+        if result == 1:
+            logger.debug("An error when trying to get the search response.\n")
+            logger.debug("Returning now!")
             return 1
+        hit_count, answer_id = read_artist_search_page(
+            result, normalized_name, seen_artists)
+        if hit_count == 0:
+            logger.debug("Search page " + str(page) + " contained no results.")
+            break
+        if answer_id is not None:
+            return answer_id
+    if len(seen_artists) > 0:
+        answer_id = match_artist_name(artist_name, seen_artists)
+        if answer_id != 1:
+            return answer_id
+    logger.debug("We do not appear to have found the artist ID ")
+    logger.debug(" with the user's search query!")
+    logger.debug("Returning 1")
+    return 1
+
+
+def resolve_artist_ids(artist_names, mapping_data=None):
+    """
+        Bulk version of get_artist_id( ). Names already in mapping_data or
+        harvested from earlier searches are resolved without an API call, the
+        rest are searched artist_workers at a time.
 
+        Returns a dict of artist name -> artist ID (1 if it wasn't found).
+    """
+    answer = {}
+    to_search = []
+    for artist_name in artist_names:
+        if artist_name in answer:
+            continue
+        artist_id = 1
+        if mapping_data is not None:
+            artist_id = search_mapping_for_artist_id(artist_name,
+                                                     mapping_data)
+        answer[artist_name] = artist_id
+        if artist_id == 1:
+            to_search.append(artist_name)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=artist_workers) as pool:
+        for artist_name, artist_id in zip(to_search, pool.map(get_artist_id,
+                                                              to_search)):
+            answer[artist_name] = artist_id
+    return answer
 
-def read_artist_song_mapping_file(filename=None):
+
+def read_artist_song_mapping_file(filename=None, artist_name=None,
+                                  compact=False):
     """
        Utils function that reads default Genius ID mappings file.
+
+       With artist_name only that artist's songs are read (every artist
+       entry is still loaded). Used by commands that touch one artist.
+       With compact=True a read only CompactMapping is returned instead.
     """
-    default_mapping_filename = "artist_song_id_mapping.json"
     if filename is None:
         logger.debug("No filename passed to read_artist_song_mapping_file().")
         logger.debug("We are going to use the default filename.")
         filename = default_mapping_filename
     try:
-        with open(filename) as f:
-            data = json.load(f)
-            logger.debug("We've opened the file and loaded it into memory.")
+        store = get_mapping_store(filename)
+        with metrics.stage("mapping_load"):
+            data = None
+            if artist_name is not None:
+                data = store.load_artist(artist_name)
+            if data is None:
+                data = store.load()
+            if compact is True:
+                data = CompactMapping(data)
+            else:
+                data = MappingData(data)
+        logger.debug("We've opened the file and loaded it into memory.")
     except Exception as e:
-        logger.debug("Error occurred when attempting to open the json file.")
+        logger.debug("Error occurred when attempting to open the mapping.")
         logger.debug("The error that occurred is: " + str(e))
         data = 1
     return data
 
 
+def read_mapping_without_songs(filename=None):
+    """
+       Utils function: Reads every artist entry, crawl state and annotation
+       coverage but none of the songs. --serve uses it to pick up artists
+       other Kanyus processes added.
+
+       Returns 1 if an error occurred.
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    try:
+        store = get_mapping_store(filename)
+        with metrics.stage("mapping_load"):
+            data = store.load_without_songs()
+            if data is None:
+                data = store.load()
+                data["songs_to_annotate"] = {}
+    except Exception as e:
+        logger.debug("Error occurred when attempting to open the mapping.")
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
+    return MappingData(data)
+
+
+def get_mapping_version(filename=None):
+    """
+       Utils function: The mtime and size of every file the mapping for
+       filename is kept in (the JSON journal and the SQLite WAL included),
+       so callers can tell if it changed without reading it.
+    """
+    if filename is None:
+        filename = default_mapping_filename
+    version = []
+    for name in (filename, filename + ".journal", filename + "-wal"):
+        try:
+            stat = os.stat(name)
+        except OSError:
+            version.append(None)
+        else:
+            version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
 def save_artist_song_mapping_file(new_mapping_data=None, filename=None):
     """
         Utils function: Overwrites mapping data. It's used for prune-ing
@@ -314,11 +3337,14 @@ def save_artist_song_mapping_file(new_mapping_data=None, filename=None):
     if filename is None:
         logger.debug("No filename was passed to add_to_artist_mapping.")
         logger.debug("Using the default name.")
-        filename = "artist_song_id_mapping.json"
+        filename = default_mapping_filename
 
-    # Save the JSON file
-    with open(filename, 'w') as f:
-        json.dump(mapping_data, f)
+    try:
+        get_mapping_store(filename).save(new_mapping_data)
+    except Exception as e:
+        logger.debug("Error occurred when attempting to save the mapping.")
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
 
     logger.debug("Okay it looks like everything went good. Returning 0!")
     return 0
@@ -335,19 +3361,16 @@ def search_mapping_for_artist_id(given_artist_name=None, mapping_data=None):
                      " was not passed the proper parameters.")
         return 1
 
-    answer_id = 1
-    artist_mappings = mapping_data["artists"]
-
-    for artist in artist_mappings:
-        if given_artist_name in artist["names"]:
-            logger.debug("We found a match. The artist ID appears to be: " +
-                         str(artist["ID"]))
-            answer_id = artist["ID"]
+    names_index, artist_entries = get_artist_index(mapping_data)
+    answer_id = names_index.get(normalize_artist_name(given_artist_name), 1)
+    if answer_id != 1:
+        logger.debug("We found a match. The artist ID appears to be: " +
+                     str(answer_id))
 
     return answer_id
 
 
-def search_genius(query=None):
+def search_genius(query=None, page=None):
     """
         Wrapper for the /search Genius API endpoint.
 
@@ -358,20 +3381,129 @@ def search_genius(query=None):
         logger.debug("search_genius() was not passed the proper parameters.")
         logger.debug("Using Gorillaz now to search for the Gorillaz band id.")
         query = "Gorillaz"
-    search_url = base_url + "search?q=" + str(query)
-    headerz = {"Authorization": "Bearer " + str(api_token)}
-    r = requests.get(search_url, headers=headerz)
-    if r.status_code == 200:
+    try:
+        answer = request_genius_json("search", get_search_params(query, page))
         logger.debug("The /search call was successful!\n")
-        answer = r.json()
-    else:
+    except GeniusAPIError as e:
         logger.debug("The call to /search was not successful!")
-        logger.debug("The r.status_code is: " + str(r.status_code) + "\n")
-        logger.debug("The r.text is: " + str(r.text))
+        logger.debug(str(e))
         answer = 1
     return answer
 
 
+class AsyncGeniusClient:
+    """
+        asyncio counterpart of the Genius endpoint wrappers.
+
+        Calls run on a thread pool against the same pooled GeniusClient
+        (session, rate limiter and cache) the sync wrappers use, and at most
+        max_concurrency of them are in flight at once. Errors are raised as
+        GeniusAPIError instead of returning 1, and every method returns the
+        decoded JSON body.
+    """
+
+    def __init__(self, max_concurrency=None):
+        import asyncio
+
+        if max_concurrency is None:
+            max_concurrency = pool_size
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def run(self, function, *args):
+        import asyncio
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    async def search_genius(self, query, page=None):
+        return await self.run(request_genius_json, "search",
+                              get_search_params(query, page))
+
+    async def get_artist_id(self, artist_name):
+        """
+            Same lookup as get_artist_id( ): harvested names first, then up
+            to search_max_pages of /search hits and match_artist_name( ).
+
+            Raises GeniusNotFoundError if we couldn't find the artist.
+        """
+        normalized_name = normalize_artist_name(artist_name)
+        artist_id = get_harvested_artist_id(normalized_name)
+        if artist_id is not None:
+            return artist_id
+        seen_artists = {}
+        for page in range(1, search_max_pages + 1):
+            hit_count, artist_id = read_artist_search_page(
+                await self.search_genius(artist_name, page), normalized_name,
+                seen_artists)
+            if hit_count == 0:
+                break
+            if artist_id is not None:
+                return artist_id
+        artist_id = match_artist_name(artist_name, seen_artists)
+        if artist_id == 1:
+            raise GeniusNotFoundError("Could not find the artist ID for " +
+                                      str(artist_name))
+        return artist_id
+
+    async def get_song_information(self, song_id):
+        return await self.run(request_genius_json, "songs/" + str(song_id))
+
+    async def get_artist_data_genius(self, artist_id):
+        return await self.run(request_genius_json, "artists/" +
+                              str(artist_id))
+
+    async def get_annotation_information(self, annotation_id):
+        return await self.run(request_genius_json, "annotations/" +
+                              str(annotation_id))
+
+    async def get_artist_songs_genius(self, artist_id, sort=None,
+                                      stop_when=None, prefetch=None):
+        """
+            Pages through the artist's songs with the same ArtistSongPager
+            rules (and stop_when / prefetch) as iter_artist_song_pages( ).
+            Songs come back in page order.
+        """
+        import asyncio
+
+        pager = ArtistSongPager(stop_when, prefetch)
+        song_ids = []
+        pending_pages = collections.deque()
+        try:
+            for page in pager.first_pages():
+                pending_pages.append(asyncio.ensure_future(self.run(
+                    get_the_next_page_of_artist_songs, page, artist_id,
+                    sort)))
+            while pending_pages:
+                songs, page = pager.read_page(await pending_pages.popleft())
+                song_ids.extend(songs)
+                if page is None:
+                    break
+                pending_pages.append(asyncio.ensure_future(self.run(
+                    get_the_next_page_of_artist_songs, page, artist_id,
+                    sort)))
+        finally:
+            for future in pending_pages:
+                future.cancel()
+        return song_ids
+
+    async def get_low_popularity_artist_songs(self, artist_id):
+        artist_songs = await self.get_artist_songs_genius(artist_id)
+        return get_list_of_low_popularity_artist_songs(artist_songs, artist_id)
+
+
 def pretty_print(given_artist_name, mapping_data):
     """
         Utils function: This function takes a given name and tries to
@@ -386,7 +3518,12 @@ def pretty_print(given_artist_name, mapping_data):
     else:
         logger.debug("We were able to find the artist ID in our mapping.")
         try:
-            songs_list = mapping_data["songs_to_annotate"][str(artist_id)]
+            if isinstance(mapping_data, CompactMapping):
+                songs_list = [song.to_dict() for song in mapping_data.
+                              get_songs_to_annotate()[str(artist_id)]]
+            else:
+                songs_list = mapping_data["songs_to_annotate"][
+                    str(artist_id)]
         except Exception as e:
             logger.debug("We encountered an error: " + str(e))
             logger.debug("I think the artist doesn't have songs in mapping.")
@@ -400,7 +3537,424 @@ def pretty_print(given_artist_name, mapping_data):
         return 0
 
 
-def prune_artist_songs(given_artist_name, mapping_data):
+query_sort_keys = ("song_name", "song_id", "annotations", "date_added",
+                   "artist")
+query_fields = ("artist_id", "artist_name", "song_name", "song_id",
+                "song_note_amt", "song_url", "date_added")
+
+
+def query_songs(mapping_data, text=None, substring=None, artist_name=None,
+                min_annotation_count=None, max_annotation_count=None,
+                added_since=None, added_until=None, sort_by="song_name",
+                descending=False, offset=0, limit=None):
+    """
+        Utils function: Finds songs across the whole mapping for --query.
+
+        text matches titles having every one of its words, substring any
+        part of the title (both ignore case). The other arguments filter on
+        an artist name or alias, the annotation count and the ISO date the
+        song was added (songs from before we recorded it never match a date
+        filter). sort_by is one of query_sort_keys.
+
+        Returns (number of matching songs, list of result row dicts for the
+        offset:offset + limit page) or 1 if artist_name isn't in our mapping.
+    """
+    if sort_by not in query_sort_keys:
+        raise ValueError("Can't sort by " + str(sort_by))
+    query_index = get_query_index(mapping_data)
+    positions = query_index.search(text, substring)
+    if artist_name is not None:
+        artist_id = search_mapping_for_artist_id(artist_name, mapping_data)
+        if artist_id == 1:
+            return 1
+        artist = query_index.artists.get(str(artist_id), (None, 0, ()))
+        artist_positions = {position for position in artist[2]
+                            if query_index.entries[position] is not None}
+        if positions is None:
+            positions = artist_positions
+        else:
+            positions &= artist_positions
+
+    if min_annotation_count is not None or max_annotation_count is not None \
+            or added_since is not None or added_until is not None:
+        if positions is None:
+            positions = (position for position, entry
+                         in enumerate(query_index.entries)
+                         if entry is not None)
+        song_note_amts = query_index.song_note_amts
+        dates_added = query_index.dates_added
+        if min_annotation_count is not None:
+            positions = (position for position in positions
+                         if song_note_amts[position] >= min_annotation_count)
+        if max_annotation_count is not None:
+            positions = (position for position in positions
+                         if song_note_amts[position] <= max_annotation_count)
+        if added_since is not None or added_until is not None:
+            positions = (position for position in positions
+                         if dates_added[position] is not None)
+        if added_since is not None:
+            positions = (position for position in positions
+                         if dates_added[position] >= added_since)
+        if added_until is not None:
+            positions = (position for position in positions
+                         if dates_added[position] <= added_until)
+        positions = set(positions)
+
+    names_index, artist_entries = get_artist_index(mapping_data)
+
+    def get_artist_name(artist_key):
+        try:
+            return artist_entries[int(artist_key)]["names"][0]
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    artist_names = None
+    if sort_by == "artist":
+        artist_names = {artist_key: get_artist_name(artist_key)
+                        for artist_key in query_index.artists}
+
+    if limit is None:
+        limit = query_index.live_count()
+    if positions is None:
+        total = query_index.live_count()
+        order = query_index.get_order(sort_by, artist_names)
+        if descending:
+            page = order[::-1][offset:offset + limit]
+        else:
+            page = order[offset:offset + limit]
+    elif sort_by in query_index.orders or \
+            len(positions) * 8 > query_index.live_count():
+        # Lots of matches, walk the order we keep instead of sorting them.
+        total = len(positions)
+        order = query_index.get_order(sort_by, artist_names)
+        if descending:
+            order = reversed(order)
+        page = []
+        for position in order:
+            if position in positions:
+                page.append(position)
+                if len(page) == offset + limit:
+                    break
+        page = page[offset:]
+    else:
+        total = len(positions)
+        page = sorted(positions,
+                      key=query_index.get_sort_key(sort_by, artist_names),
+                      reverse=descending)[offset:offset + limit]
+
+    rows = []
+    for position in page:
+        artist_key, song = query_index.entries[position]
+        rows.append({"artist_id": int(artist_key),
+                     "artist_name": get_artist_name(artist_key),
+                     "song_name": song.get("song_name"),
+                     "song_id": song["song_id"],
+                     "song_note_amt": song.get("song_note_amt"),
+                     "song_url": song.get("song_url"),
+                     "date_added": song.get("date_added")})
+    return total, rows
+
+
+def write_query_results(total, rows, output_format="text", f=None):
+    """
+        Utils function: Writes query_songs( ) results to f (stdout by
+        default) as "json", "csv" or tab separated "text".
+    """
+    if f is None:
+        f = sys.stdout
+    if output_format == "json":
+        f.write(get_json_codec().dumps({"total": total, "songs": rows}) +
+                "\n")
+    elif output_format == "csv":
+        writer = csv.DictWriter(f, fieldnames=query_fields,
+                                lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            f.write("\t".join("" if row[field] is None else str(row[field])
+                              for field in query_fields) + "\n")
+        f.write(str(len(rows)) + " of " + str(total) + " matching songs\n")
+    return 0
+
+
+def read_artist_names(artists_filename):
+    """
+        Utils function: Reads artist names for --artists-file. Each line is a
+        plain name, a JSON string or a JSON object with a "name" or "artist"
+        key. Blank lines are skipped and "-" reads from stdin.
+    """
+    if artists_filename == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(artists_filename) as f:
+            lines = f.readlines()
+    artist_names = []
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line[0] in "{\"":
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = line
+            if isinstance(entry, dict):
+                entry = entry.get("name", entry.get("artist"))
+            if entry is None:
+                logger.debug("Skipping line without an artist name: " + line)
+                continue
+            line = str(entry)
+        artist_names.append(line)
+    return artist_names
+
+
+def get_songs_to_annotate_for_artist(artist_name, artist_id=None,
+                                     crawl_state=None, incremental=False):
+    """
+        Worker function for crawl_artists_batch( )
+
+        Looks up the artist ID if we don't have it yet, gets all of the
+        artist's songs and filters them down to low popularity songs. It
+        doesn't touch the mapping so it's safe to run in a thread.
+
+        Returns a dict report for the artist. "error" is set if anything
+        went wrong.
+    """
+    report = {"artist_name": artist_name, "artist_id": artist_id,
+              "new_artist": False, "songs_seen": 0, "songs": [],
+              "crawl_state": None, "error": None}
+    started_at = time.monotonic()
+    if artist_id is None:
+        artist_id = get_artist_id(artist_name)
+        if artist_id == 1:
+            report["error"] = "could not find the artist ID"
+            report["seconds"] = time.monotonic() - started_at
+            return report
+        report["artist_id"] = artist_id
+        report["new_artist"] = True
+    new_crawl_state = {}
+    try:
+        for songs_to_annotate in iter_artist_songs_to_annotate(
+                artist_id, crawl_state, incremental, new_crawl_state):
+            report["songs"].extend(songs_to_annotate)
+        report["crawl_state"] = new_crawl_state
+        report["songs_seen"] = new_crawl_state["songs_seen"]
+    except (GeniusAPIError, ValueError, KeyError) as e:
+        logger.debug("The error that occurred is: " + str(e))
+        report["error"] = "could not get the artist's songs"
+    report["seconds"] = time.monotonic() - started_at
+    return report
+
+
+def get_crawl_worker_settings(workers):
+    """
+        Utils function: The settings a --workers process needs from us.
+        Processes are spawned, so anything the command line changed has to
+        be passed along. Each one gets an equal share of our rate limit.
+    """
+    return {"min_annotations": min_annotations,
+            "max_annotations": max_annotations,
+            "top_songs_count": top_songs_count,
+            "accept_fuzzy_matches": accept_fuzzy_matches,
+            "cache_enabled": cache_enabled,
+            "requests_per_second": requests_per_second / workers,
+            "burst_size": max(1, burst_size // workers),
+            "log_level": logger.getEffectiveLevel()}
+
+
+def init_crawl_worker(settings):
+    """
+        Pool initializer for --workers processes.
+    """
+    global min_annotations, max_annotations, top_songs_count, \
+        cache_enabled, requests_per_second, burst_size, accept_fuzzy_matches
+    min_annotations = settings["min_annotations"]
+    max_annotations = settings["max_annotations"]
+    top_songs_count = settings["top_songs_count"]
+    accept_fuzzy_matches = settings["accept_fuzzy_matches"]
+    cache_enabled = settings["cache_enabled"]
+    requests_per_second = settings["requests_per_second"]
+    burst_size = settings["burst_size"]
+    logging.basicConfig(level=settings["log_level"], format='%(message)s')
+
+
+def crawl_artist_in_worker(task):
+    """
+        Worker function for --workers processes. Runs
+        get_songs_to_annotate_for_artist( ) and sends the songs back as
+        tuples of CompactSong.keys values, which pickle much smaller than
+        dicts. The metrics and cache stats recorded for the artist go back
+        with them so --stats and --cache-stats cover the whole run.
+    """
+    report = get_songs_to_annotate_for_artist(*task)
+    report["songs"] = [tuple(song[key] for key in CompactSong.keys)
+                       for song in report["songs"]]
+    report["metrics"] = metrics.take_counts()
+    report["cache_stats"] = {}
+    if genius_client is not None and genius_client.cache is not None:
+        report["cache_stats"] = genius_client.cache.take_stats()
+    return report
+
+
+def iter_artist_reports(tasks, workers=None):
+    """
+        Generator that crawls (artist name, artist ID, crawl state,
+        incremental) tasks and yields each artist's report as it finishes.
+
+        By default a pool of artist_workers threads does the crawling. With
+        workers > 1 the tasks are handed out one by one to that many
+        processes instead, each with its own HTTP pool and an equal share of
+        the rate limit, so JSON decoding and filtering use every core.
+    """
+    if workers is None or workers <= 1:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=artist_workers) as pool:
+            futures = [pool.submit(get_songs_to_annotate_for_artist, *task)
+                       for task in tasks]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        return
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, init_crawl_worker,
+                      (get_crawl_worker_settings(workers),)) as pool:
+        for report in pool.imap_unordered(crawl_artist_in_worker, tasks):
+            report["songs"] = [dict(zip(CompactSong.keys, song))
+                               for song in report["songs"]]
+            metrics.merge_counts(report.pop("metrics"))
+            worker_cache_stats.update(report.pop("cache_stats"))
+            yield report
+
+
+def crawl_artists_batch(artist_names, mapping_data, filename=None,
+                        incremental=False, workers=None):
+    """
+        Crawls many artists in one run. Artists are crawled by
+        iter_artist_reports( ) (threads, or processes with workers > 1) and
+        merged into the mapping from this thread as they finish, so there is
+        only ever one writer. Each artist is written in its own short
+        transaction so other processes sharing a SQLite mapping aren't
+        locked out for the whole batch.
+
+        Returns the list of per artist reports.
+    """
+    reports = []
+    started_at = time.monotonic()
+    store = get_mapping_store(filename)
+    tasks = []
+    seen_names = set()
+    for artist_name in artist_names:
+        if normalize_artist_name(artist_name) in seen_names:
+            logger.debug("Skipping duplicate artist: " + artist_name)
+            continue
+        seen_names.add(normalize_artist_name(artist_name))
+        artist_id = search_mapping_for_artist_id(artist_name, mapping_data)
+        crawl_state = None
+        if artist_id == 1:
+            artist_id = None
+        else:
+            crawl_state = mapping_data.get("crawl_state", {}).get(
+                str(artist_id))
+        tasks.append((artist_name, artist_id, crawl_state, incremental))
+    for report in iter_artist_reports(tasks, workers):
+        if report["error"] is None:
+            with store.deferred():
+                if report["new_artist"] is True:
+                    add_to_artist_mapping(report["artist_id"],
+                                          report["artist_name"],
+                                          mapping_data, filename)
+                report["summary"] = add_to_songs_mapping(
+                    report["artist_id"], report.pop("songs"), mapping_data,
+                    filename)
+                update_crawl_state(report["artist_id"], report["crawl_state"],
+                                   mapping_data, filename)
+            logger.info("[" + str(len(reports) + 1) + "/" +
+                        str(len(tasks)) + "] " +
+                        str(report["artist_name"]) + ": " +
+                        str(report["songs_seen"]) + " songs, " +
+                        str(report["summary"]["added"]) +
+                        " new to annotate in " +
+                        "%.1fs" % report["seconds"])
+        else:
+            report.pop("songs")
+            logger.info("[" + str(len(reports) + 1) + "/" +
+                        str(len(tasks)) + "] " +
+                        str(report["artist_name"]) + ": " +
+                        report["error"])
+        reports.append(report)
+    failed = [report for report in reports if report["error"] is not None]
+    logger.info("Crawled " + str(len(reports) - len(failed)) + " of " +
+                str(len(reports)) + " artists in " +
+                "%.1fs" % (time.monotonic() - started_at))
+    for report in failed:
+        logger.info("Failed: " + str(report["artist_name"]) + " (" +
+                    report["error"] + ")")
+    return reports
+
+
+def check_song_annotation_count(song):
+    """
+        Worker function for prune_song_lists( )
+
+        Returns the current annotation_count for a song in our mapping or
+        None if we could not get it from the API.
+    """
+    logger.debug("Getting information for song: " + str(song["song_name"]))
+    try:
+        update_check = get_song_information(song["song_id"])
+        return update_check["response"]["song"]["annotation_count"]
+    except Exception as e:
+        logger.debug("We could not check song " + str(song["song_id"]) +
+                     ". The error is: " + str(e))
+        return None
+
+
+def prune_song_lists(song_lists):
+    """
+        Utils function: Takes a dict of artist ID -> list of mapping songs and
+        checks every song against the API with a pool of prune_workers.
+
+        Returns a dict of artist ID -> (songs to keep, songs we couldn't
+        check). Songs we couldn't check are kept as well.
+    """
+    answer = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=prune_workers) as \
+            pool:
+        checks = {}
+        for artist_id, songs_list in song_lists.items():
+            checks[artist_id] = [(song, pool.submit(
+                check_song_annotation_count, song)) for song in songs_list]
+        for artist_id, song_checks in checks.items():
+            new_songs = []
+            failed_songs = []
+            for song, future in song_checks:
+                annotation_count = future.result()
+                if annotation_count is None:
+                    failed_songs.append(song)
+                    new_songs.append(song)
+                elif min_annotations <= annotation_count <= max_annotations:
+                    new_songs.append(song)
+            answer[artist_id] = (new_songs, failed_songs)
+    return answer
+
+
+def report_failed_prune_checks(failed_songs):
+    """
+        Utils function: Tells the user which songs we kept because we
+        couldn't check them.
+    """
+    for song in failed_songs:
+        logger.info("Could not check song, keeping it: " + str(song))
+    if len(failed_songs) > 0:
+        logger.info("We kept " + str(len(failed_songs)) +
+                    " songs we were unable to check.")
+
+
+def prune_artist_songs(given_artist_name, mapping_data, filename=None):
+    """
+        Utils function: Re-checks each of an artist's songs in our mapping
+        against the API and drops the ones that have been annotated.
+    """
     artist_name_to_id = search_mapping_for_artist_id(given_artist_name,
                                                      mapping_data)
     if artist_name_to_id == 1:
@@ -409,21 +3963,16 @@ def prune_artist_songs(given_artist_name, mapping_data):
         return 1
     else:
         logger.debug("We were able to find the artist ID in our mapping.")
-        songs_list = mapping_data["songs_to_annotate"][str(artist_name_to_id)]
-        """
-            The approach we want to take for this is, check each song in our
-            mapping for the artist via the API. If the song now has
-
-        """
-        new_songs = []
-        for song in songs_list:
-            logger.debug("Getting information for song: " +
-                         str(song["song_name"]))
-            update_check = get_song_information(song["song_id"])
-            if update_check["response"]["song"]["annotation_count"] == 0:
-                new_songs.append(song)
-        mapping_data["songs_to_annotate"][str(artist_name_to_id)] = new_songs
-        save_result = save_artist_song_mapping_file(mapping_data)
+        artist_key = str(artist_name_to_id)
+        songs_list = mapping_data["songs_to_annotate"].get(artist_key, [])
+        pruned = prune_song_lists({artist_key: songs_list})
+        new_songs, failed_songs = pruned[artist_key]
+        report_failed_prune_checks(failed_songs)
+        logger.debug("We pruned " + str(len(songs_list) - len(new_songs)) +
+                     " songs.")
+        mapping_data["songs_to_annotate"][artist_key] = new_songs
+        save_result = replace_songs_in_mapping({artist_key: new_songs},
+                                               mapping_data, filename)
         if save_result == 0:
             logger.debug("Okay! Looks like we successfuly pruned.")
             logger.debug("Returning Now!")
@@ -434,7 +3983,170 @@ def prune_artist_songs(given_artist_name, mapping_data):
             return 1
 
 
-def erase_artist_from_mapping(given_artist_name, mapping_data):
+def prune_all_artists(mapping_data, filename=None):
+    """
+        Utils function: Prunes every artist in our mapping in one run and
+        saves the mapping once at the end.
+    """
+    song_lists = mapping_data["songs_to_annotate"]
+    pruned = prune_song_lists(song_lists)
+    failed_songs = []
+    new_song_lists = {}
+    pruned_count = 0
+    for artist_key, (new_songs, artist_failed_songs) in pruned.items():
+        pruned_count += len(song_lists[artist_key]) - len(new_songs)
+        failed_songs.extend(artist_failed_songs)
+        new_song_lists[artist_key] = new_songs
+    mapping_data["songs_to_annotate"].update(new_song_lists)
+    report_failed_prune_checks(failed_songs)
+    logger.debug("We pruned " + str(pruned_count) + " songs across " +
+                 str(len(pruned)) + " artists.")
+    save_result = replace_songs_in_mapping(new_song_lists, mapping_data,
+                                           filename)
+    if save_result == 0:
+        logger.debug("Okay! Looks like we successfuly pruned everyone.")
+        return 0
+    else:
+        logger.debug("Yikes, it looks like we encountered an issue.")
+        return 1
+
+
+def replace_songs_in_mapping(song_lists, mapping_data, filename=None):
+    """
+        Utils function: Saves new song lists (artist ID -> songs) for the
+        given artists in one go. mapping_data must already hold them.
+
+        Returns 0 on success or 1 if an error occurred.
+    """
+    store = get_mapping_store(filename)
+    try:
+        with store.deferred():
+            for artist_key, songs in song_lists.items():
+                store.replace_songs(mapping_data, artist_key, songs)
+    except Exception as e:
+        logger.debug("Error occurred when attempting to save the mapping.")
+        logger.debug("The error that occurred is: " + str(e))
+        return 1
+    return 0
+
+
+def get_song_annotation_coverage(song):
+    """
+        Worker function for check_annotation_coverage( )
+
+        Pages through a song's referents and boils them down to a compact
+        summary: how many fragments are annotated, how many annotations and
+        verified annotations they have and how many characters of the
+        lyrics they cover.
+
+        Returns the summary dict or None if we could not get it from the API.
+    """
+    summary = {"checked_at": int(time.time()), "referents": 0,
+               "annotations": 0, "verified": 0, "annotated_chars": 0}
+    next_page = 1
+    try:
+        while next_page is not None:
+            referents = get_the_next_page_of_song_referents(
+                next_page, song["song_id"]).get("referents") or []
+            for referent in referents:
+                annotations = referent.get("annotations") or []
+                summary["referents"] += 1
+                summary["annotations"] += len(annotations)
+                summary["verified"] += sum(
+                    1 for annotation in annotations
+                    if annotation.get("verified") is True)
+                summary["annotated_chars"] += len(referent.get("fragment") or
+                                                  "")
+            if len(referents) < referents_per_page:
+                next_page = None
+            else:
+                next_page += 1
+    except (GeniusAPIError, ValueError, KeyError) as e:
+        logger.debug("We could not check the referents of song " +
+                     str(song["song_id"]) + ". The error is: " + str(e))
+        return None
+    return summary
+
+
+def check_annotation_coverage(songs, annotation_coverage):
+    """
+        Utils function: Gets the coverage summary of every song in songs that
+        wasn't checked in the last coverage_interval, coverage_workers songs
+        at a time.
+
+        Returns (song ID -> new summary, songs we couldn't check).
+    """
+    now = time.time()
+    to_check = [song for song in songs if now - annotation_coverage.get(
+        str(song["song_id"]), {}).get("checked_at", 0) >= coverage_interval]
+    logger.debug("Checking coverage of " + str(len(to_check)) + " of " +
+                 str(len(songs)) + " songs.")
+    coverage = {}
+    failed_songs = []
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=coverage_workers) as pool:
+        for song, summary in zip(to_check, pool.map(
+                get_song_annotation_coverage, to_check)):
+            if summary is None:
+                failed_songs.append(song)
+            else:
+                coverage[str(song["song_id"])] = summary
+    return coverage, failed_songs
+
+
+def report_annotation_coverage(songs, annotation_coverage):
+    """
+        Utils function: Lists songs from the least to the most annotated
+        lyrics, going by annotated characters, then annotations.
+    """
+    covered_songs = [(annotation_coverage[str(song["song_id"])], song)
+                     for song in songs
+                     if str(song["song_id"]) in annotation_coverage]
+    covered_songs.sort(key=lambda pair: (pair[0]["annotated_chars"],
+                                         pair[0]["annotations"]))
+    for summary, song in covered_songs:
+        logger.info(str(song["song_name"]) + " (" + str(song["song_id"]) +
+                    "): " + str(summary["annotations"]) + " annotations on " +
+                    str(summary["referents"]) + " fragments, " +
+                    str(summary["annotated_chars"]) +
+                    " characters annotated, " +
+                    str(summary["verified"]) + " verified. " +
+                    str(song["song_url"]))
+
+
+def annotation_coverage_for_artist(given_artist_name, mapping_data,
+                                   filename=None):
+    """
+        Utils function: Checks how much of each of an artist's songs in our
+        mapping is annotated, saves the summaries in the mapping and lists
+        the songs from the least to the most covered.
+    """
+    artist_name_to_id = search_mapping_for_artist_id(given_artist_name,
+                                                     mapping_data)
+    if artist_name_to_id == 1:
+        logger.debug("We were unable to find the artist ID in our mapping.")
+        logger.debug("Returning Now!")
+        return 1
+    songs_list = mapping_data["songs_to_annotate"].get(
+        str(artist_name_to_id), [])
+    annotation_coverage = mapping_data.get("annotation_coverage", {})
+    coverage, failed_songs = check_annotation_coverage(songs_list,
+                                                       annotation_coverage)
+    for song in failed_songs:
+        logger.info("Could not check the coverage of song: " + str(song))
+    if len(coverage) > 0:
+        try:
+            update_annotation_coverage(coverage, mapping_data, filename)
+        except Exception as e:
+            logger.debug("Error occurred when attempting to save the mapping.")
+            logger.debug("The error that occurred is: " + str(e))
+            return 1
+    report_annotation_coverage(songs_list,
+                               mapping_data.get("annotation_coverage", {}))
+    return 0
+
+
+def erase_artist_from_mapping(given_artist_name, mapping_data, filename=None):
     """
         Utils Function: Used to remove a given_artist_name from
         our mapping.
@@ -448,7 +4160,18 @@ def erase_artist_from_mapping(given_artist_name, mapping_data):
     else:
         logger.debug("We were able to find the artist ID in our mapping.")
         mapping_data["songs_to_annotate"].pop(str(artist_name_to_id), None)
-        save_result = save_artist_song_mapping_file(mapping_data)
+        # Without this an --incremental crawl would stop at the old high
+        # water mark and never bring the erased songs back.
+        mapping_data.get("crawl_state", {}).pop(str(artist_name_to_id), None)
+        try:
+            store = get_mapping_store(filename)
+            with store.deferred():
+                store.remove_artist_songs(mapping_data, artist_name_to_id)
+                store.remove_crawl_state(mapping_data, artist_name_to_id)
+            save_result = 0
+        except Exception as e:
+            logger.debug("The error that occurred is: " + str(e))
+            save_result = 1
         if save_result != 1:
             logger.debug("Okay! We saved the new file. Returning Now!")
             return 0
@@ -457,6 +4180,190 @@ def erase_artist_from_mapping(given_artist_name, mapping_data):
             return 1
 
 
+def get_refresh_due_at(crawl_state):
+    """
+        Utils function: When --serve should next refresh an artist. Artists
+        we never refreshed are due right away. Otherwise it's
+        serve_refresh_interval after the last refresh, shortened by the churn
+        (the share of songs that were added or pruned) we saw last time.
+    """
+    if crawl_state is None or "last_refresh" not in crawl_state:
+        return 0
+    churn = crawl_state.get("churn", 0.0)
+    return crawl_state["last_refresh"] + serve_refresh_interval / \
+        (1.0 + serve_churn_weight * churn)
+
+
+def refresh_artist(artist_id, mapping_data, filename=None):
+    """
+        Worker function for serve_mapping( )
+
+        Incrementally crawls an artist for new songs, re-checks the next
+        serve_prune_batch of their songs (round robin, so every song gets
+        its turn) and saves both, plus the artist's new crawl state with the
+        refresh time, churn and prune cursor.
+
+        Returns a dict report for the artist. Raises GeniusAPIError if the
+        crawl fails.
+    """
+    artist_key = str(artist_id)
+    crawl_state = mapping_data.get("crawl_state", {}).get(artist_key)
+    new_crawl_state = {}
+    summary = {"added": 0, "already_present": 0, "updated": 0}
+    for songs_to_annotate in iter_artist_songs_to_annotate(
+            artist_id, crawl_state, True, new_crawl_state):
+        page_summary = add_to_songs_mapping(artist_id, songs_to_annotate,
+                                            mapping_data, filename)
+        for key in summary:
+            summary[key] += page_summary[key]
+
+    songs_list = mapping_data["songs_to_annotate"].get(artist_key, [])
+    prune_cursor = (crawl_state or {}).get("prune_cursor", 0)
+    if prune_cursor >= len(songs_list):
+        prune_cursor = 0
+    batch = songs_list[prune_cursor:prune_cursor + serve_prune_batch]
+    kept_songs, failed_songs = prune_song_lists({artist_key: batch})[
+        artist_key]
+    kept_song_ids = set(song["song_id"] for song in kept_songs)
+    pruned_song_ids = set(song["song_id"] for song in batch
+                          if song["song_id"] not in kept_song_ids)
+    if len(pruned_song_ids) > 0:
+        songs_list = [song for song in songs_list
+                      if song["song_id"] not in pruned_song_ids]
+        mapping_data["songs_to_annotate"][artist_key] = songs_list
+        replace_songs_in_mapping({artist_key: songs_list}, mapping_data,
+                                 filename)
+    report_failed_prune_checks(failed_songs)
+
+    checked_count = new_crawl_state["songs_seen"] + len(batch)
+    churn = (summary["added"] + len(pruned_song_ids)) / max(1, checked_count)
+    if crawl_state is not None and "churn" in crawl_state:
+        churn = (crawl_state["churn"] + churn) / 2.0
+    new_crawl_state["last_refresh"] = time.time()
+    new_crawl_state["churn"] = churn
+    new_crawl_state["prune_cursor"] = prune_cursor + len(batch) - \
+        len(pruned_song_ids)
+    update_crawl_state(artist_id, new_crawl_state, mapping_data, filename)
+    return {"artist_id": artist_id, "added": summary["added"],
+            "pruned": len(pruned_song_ids), "checked": len(batch),
+            "churn": churn}
+
+
+def serve_mapping(filename=None, max_refreshes=None, stats_files=None):
+    """
+        Keeps the mapping fresh until interrupted (or max_refreshes artist
+        refreshes are done). stats_files is a (JSON filename, Prometheus
+        textfile filename) pair, either can be None, that report_stats( )
+        rewrites every serve_stats_interval seconds.
+
+        Every artist in the mapping sits in a heapq ordered by when it's due
+        (see get_refresh_due_at( )). We refresh the most overdue artist with
+        refresh_artist( ), which writes its changes right away, and push it
+        back with its new due time. The shared rate limiter is slowed down to
+        serve_requests_per_minute, including the limiter of a GeniusClient
+        made before we were called, so the daemon never bursts through our
+        API quota. The artist being refreshed is re-read right before, and
+        while idle the artist list (no songs) is re-read whenever the
+        mapping's files changed, so artists and songs other Kanyus
+        processes add are picked up. API and mapping store errors put the
+        artist back in the queue for serve_retry_interval.
+    """
+    global requests_per_second, burst_size
+    requests_per_second = min(requests_per_second,
+                              serve_requests_per_minute / 60.0)
+    burst_size = max(1, min(burst_size, int(requests_per_second * 10)))
+    with genius_client_lock:
+        if genius_client is not None:
+            genius_client.limiter.set_rate(requests_per_second, burst_size)
+    logger.info("Serving " + str(filename or default_mapping_filename) +
+                " at up to " + str(serve_requests_per_minute) +
+                " requests per minute.")
+    queue = []
+    queued_artist_ids = set()
+    artist_names = {}
+    refresh_count = 0
+    mapping_version = get_mapping_version(filename)
+    mapping_data = read_mapping_without_songs(filename)
+    stats_due_at = time.monotonic() + serve_stats_interval
+    while max_refreshes is None or refresh_count < max_refreshes:
+        if stats_files is not None and time.monotonic() >= stats_due_at:
+            stats_due_at = time.monotonic() + serve_stats_interval
+            try:
+                report_stats(stats_files[0], stats_files[1], False)
+            except OSError as e:
+                logger.info("We were unable to write the stats: " + str(e))
+        if mapping_data == 1:
+            logger.info("We were unable to read the mapping, retrying soon.")
+            time.sleep(60)
+            mapping_version = get_mapping_version(filename)
+            mapping_data = read_mapping_without_songs(filename)
+            continue
+        for artist in mapping_data["artists"]:
+            artist_names[artist["ID"]] = artist["names"][0]
+            if artist["ID"] not in queued_artist_ids:
+                queued_artist_ids.add(artist["ID"])
+                heapq.heappush(queue, (get_refresh_due_at(
+                    mapping_data.get("crawl_state", {}).get(
+                        str(artist["ID"]))), artist["ID"]))
+        if len(queue) == 0:
+            logger.info("There are no artists in the mapping yet.")
+            time.sleep(60)
+        else:
+            due_at, artist_id = queue[0]
+            if due_at <= time.time():
+                mapping_data = refresh_queued_artist(
+                    queue, artist_names, filename)
+                refresh_count += 1
+                continue
+            logger.debug("Next refresh is for artist " + str(artist_id) +
+                         " in %.0fs" % (due_at - time.time()))
+            sleep_seconds = min(due_at - time.time(), 60)
+            if stats_files is not None:
+                sleep_seconds = min(sleep_seconds,
+                                    stats_due_at - time.monotonic())
+            time.sleep(max(0, sleep_seconds))
+        if get_mapping_version(filename) != mapping_version:
+            mapping_version = get_mapping_version(filename)
+            mapping_data = read_mapping_without_songs(filename)
+    return 0
+
+
+def refresh_queued_artist(queue, artist_names, filename=None):
+    """
+        Worker function for serve_mapping( )
+
+        Refreshes the artist at the top of queue and pushes it back with
+        its next due time, or serve_retry_interval from now if the API or
+        the mapping store failed.
+
+        Returns the mapping that was read for the refresh or 1.
+    """
+    due_at, artist_id = heapq.heappop(queue)
+    retry_at = time.time() + serve_retry_interval
+    mapping_data = read_artist_song_mapping_file(
+        filename, artist_names[artist_id])
+    if mapping_data == 1:
+        heapq.heappush(queue, (retry_at, artist_id))
+        return 1
+    started_at = time.monotonic()
+    try:
+        report = refresh_artist(artist_id, mapping_data, filename)
+    except (GeniusAPIError, ValueError, KeyError, sqlite3.Error,
+            OSError) as e:
+        logger.info("Refreshing " + str(artist_names[artist_id]) +
+                    " failed, retrying later: " + str(e))
+        heapq.heappush(queue, (retry_at, artist_id))
+        return mapping_data
+    logger.info("Refreshed " + str(artist_names[artist_id]) + ": " +
+                str(report["added"]) + " new, " + str(report["pruned"]) +
+                " pruned of " + str(report["checked"]) + " checked in " +
+                "%.1fs, churn %.2f" % (time.monotonic() - started_at,
+                                       report["churn"]))
+    heapq.heappush(queue, (get_refresh_due_at(
+        mapping_data["crawl_state"][str(artist_id)]), artist_id))
+    return mapping_data
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(message)s')
     logger = logging.getLogger('main_thread_logger')
@@ -466,21 +4373,125 @@ if __name__ == "__main__":
     parser.add_argument("-a", "--artist", required=False, type=str,
                         dest="artist",
                         help="Name of the aritst who's songs we want to get.")
+    parser.add_argument("-A", "--artists-file", required=False, type=str,
+                        dest="artists_file",
+                        help="File of artist names to crawl, one per line "
+                        "or JSONL. Use - for stdin.")
+    parser.add_argument("--workers", required=False, type=int,
+                        dest="workers",
+                        help="Crawl the --artists-file with this many "
+                        "processes instead of threads.")
+    parser.add_argument("--resolve-ids", required=False,
+                        dest="resolve_ids_switch", action="store_true",
+                        help="Only look up the artist IDs of the "
+                        "--artists-file names, don't crawl them.")
+    parser.add_argument("--accept-fuzzy", required=False,
+                        dest="accept_fuzzy_switch", action="store_true",
+                        help="Use an artist whose name only closely "
+                        "matches the one we searched for.")
+    parser.add_argument("-i", "--incremental", required=False,
+                        dest="incremental_switch", action="store_true",
+                        help="Only crawl songs newer than the last crawl.")
+    parser.add_argument("--min-annotations", required=False, type=int,
+                        dest="min_annotations",
+                        help="Keep songs with at least this many annotations.")
+    parser.add_argument("--max-annotations", required=False, type=int,
+                        dest="max_annotations",
+                        help="Keep songs with at most this many annotations.")
+    parser.add_argument("--top", required=False, type=int,
+                        dest="top_songs_count",
+                        help="Only keep the N best scoring songs per artist.")
+    parser.add_argument("--add-alias", required=False, type=str,
+                        dest="alias_to_add",
+                        help="Another name for the --artist we already have.")
     parser.add_argument("-d", "--debug", required=False, dest="debug_switch",
                         action="store_true",
                         help="This flag will set logging to Debug mode.")
     parser.add_argument("-e", "--erasefrommapping", required=False, type=str,
                         dest="artist_entry_to_erase",
                         help="Artist name who's entry we want to remove")
+    parser.add_argument("--serve", required=False, dest="serve_switch",
+                        action="store_true",
+                        help="Keep refreshing every artist in the mapping "
+                        "within the [SERVE] request budget until stopped.")
+    parser.add_argument("-c", "--coverage", required=False, type=str,
+                        dest="coverage_artist",
+                        help="List how much of each of this artist's songs "
+                        "is annotated, least annotated first.")
     parser.add_argument("-l", "--listsongsby", required=False, type=str,
                         dest="list_songs_by",
                         help="Name of Artist we want to get songs for.")
+    parser.add_argument("-q", "--query", required=False, type=str,
+                        dest="query_text", nargs="?", const="",
+                        help="Search every song in our mapping for titles "
+                        "with these words. Combine with the filters below "
+                        "and --min-annotations / --max-annotations.")
+    parser.add_argument("--substring", required=False, type=str,
+                        dest="query_substring",
+                        help="--query titles containing this text.")
+    parser.add_argument("--query-artist", required=False, type=str,
+                        dest="query_artist",
+                        help="--query songs by this artist name or alias.")
+    parser.add_argument("--added-since", required=False, type=str,
+                        dest="added_since",
+                        help="--query songs added on or after YYYY-MM-DD.")
+    parser.add_argument("--added-until", required=False, type=str,
+                        dest="added_until",
+                        help="--query songs added on or before YYYY-MM-DD.")
+    parser.add_argument("--sort", required=False, type=str,
+                        dest="query_sort", default="song_name",
+                        choices=query_sort_keys,
+                        help="What to sort --query results by.")
+    parser.add_argument("--desc", required=False, dest="query_descending",
+                        action="store_true",
+                        help="Sort --query results in descending order.")
+    parser.add_argument("--offset", required=False, type=int,
+                        dest="query_offset", default=0,
+                        help="Skip this many --query results.")
+    parser.add_argument("--limit", required=False, type=int,
+                        dest="query_limit", default=50,
+                        help="Show at most this many --query results.")
+    parser.add_argument("--format", required=False, type=str,
+                        dest="query_format", default="text",
+                        choices=("text", "json", "csv"),
+                        help="Output format of --query results.")
     parser.add_argument("-m", "--mapping", required=False, type=str,
                         dest="mapping_file",
-                        help="Name of custom mapping file you want to use.")
+                        help="Name of custom mapping file you want to use. "
+                        "Files ending in .db, .sqlite or .sqlite3 use SQLite.")
+    parser.add_argument("--import-json", required=False, type=str,
+                        dest="json_to_import",
+                        help="JSON mapping file to import into --mapping.")
+    parser.add_argument("--export", required=False, type=str,
+                        dest="snapshot_to_export",
+                        help="Write --mapping to this compressed snapshot "
+                        "file.")
+    parser.add_argument("--import", required=False, type=str, nargs="+",
+                        dest="snapshots_to_import",
+                        help="Merge these --export snapshots into --mapping, "
+                        "skipping songs we already have.")
     parser.add_argument("-p", "--prune", required=False, type=str,
                         dest="artist_to_prune",
                         help="Name of the artist who's songs we want to prune")
+    parser.add_argument("--no-cache", required=False, dest="no_cache_switch",
+                        action="store_true",
+                        help="Don't use the on disk API response cache.")
+    parser.add_argument("--cache-stats", required=False,
+                        dest="cache_stats_switch", action="store_true",
+                        help="Print response cache statistics at exit.")
+    parser.add_argument("--stats", required=False, dest="stats_switch",
+                        action="store_true",
+                        help="Print API and timing statistics at exit.")
+    parser.add_argument("--stats-json", required=False, type=str,
+                        dest="stats_json_file",
+                        help="Write the run statistics to this JSON file.")
+    parser.add_argument("--stats-prom", required=False, type=str,
+                        dest="stats_prom_file",
+                        help="Write the run statistics to this Prometheus "
+                        "textfile.")
+    parser.add_argument("-P", "--prune-all", required=False,
+                        dest="prune_all_switch", action="store_true",
+                        help="Prune the songs of every artist in our mapping.")
     parser.add_argument("-v", "--verbose", required=False,
                         dest="verbose_switch",
                         action="store_true",
@@ -493,8 +4504,102 @@ if __name__ == "__main__":
         logger.setLevel(logging.DEBUG)
         logger.debug("User has requested debugging mode!")
 
+    if results.min_annotations is not None:
+        min_annotations = results.min_annotations
+    if results.max_annotations is not None:
+        max_annotations = results.max_annotations
+    if results.top_songs_count is not None:
+        top_songs_count = results.top_songs_count
+    if results.accept_fuzzy_switch is True:
+        accept_fuzzy_matches = True
+
+    if results.no_cache_switch is True:
+        logger.debug("User has turned off the response cache.")
+        cache_enabled = False
+    if results.cache_stats_switch is True:
+        atexit.register(report_cache_stats)
+    if results.stats_switch is True or results.stats_json_file is not None \
+            or results.stats_prom_file is not None:
+        atexit.register(report_stats, results.stats_json_file,
+                        results.stats_prom_file, results.stats_switch)
+
+    if results.json_to_import is not None:
+        logger.debug("The user wants to import a JSON mapping file.")
+        import_result = import_mapping_file(results.json_to_import,
+                                            results.mapping_file)
+        if import_result != 1:
+            logger.info("Imported " + str(results.json_to_import) +
+                        " into the mapping.")
+        else:
+            logger.info("We were unable to import " +
+                        str(results.json_to_import))
+        sys.exit()
+
+    if results.snapshot_to_export is not None:
+        logger.debug("The user wants to export the mapping.")
+        export_result = export_mapping_snapshot(results.snapshot_to_export,
+                                                results.mapping_file)
+        if export_result != 1:
+            logger.info("Exported " + str(export_result[0]) + " artists and " +
+                        str(export_result[1]) + " songs to " +
+                        str(results.snapshot_to_export))
+        else:
+            logger.info("We were unable to export to " +
+                        str(results.snapshot_to_export))
+        sys.exit()
+
+    if results.snapshots_to_import is not None:
+        logger.debug("The user wants to merge snapshots into the mapping.")
+        import_result = import_mapping_snapshots(results.snapshots_to_import,
+                                                 results.mapping_file)
+        if import_result != 1:
+            logger.info("Imported " + str(import_result["songs"]) +
+                        " new songs and " + str(import_result["artists"]) +
+                        " new artists, skipped " +
+                        str(import_result["duplicates"]) +
+                        " songs we already had.")
+        else:
+            logger.info("We were unable to import " +
+                        " ".join(results.snapshots_to_import))
+        sys.exit()
+
+    if results.serve_switch is True:
+        logger.debug("The user wants to keep the mapping fresh.")
+        try:
+            stats_files = None
+            if results.stats_json_file is not None or \
+                    results.stats_prom_file is not None:
+                stats_files = (results.stats_json_file,
+                               results.stats_prom_file)
+            serve_mapping(results.mapping_file, stats_files=stats_files)
+        except KeyboardInterrupt:
+            logger.info("Stopped serving.")
+        sys.exit()
+
+    # Listing and erasing only need one artist's songs, listing and querying
+    # only read them so they get a CompactMapping.
+    partial_artist_name = None
+    read_only = False
+    if results.prune_all_switch is not True and \
+            results.artist_to_prune is None:
+        read_only = results.list_songs_by is not None or \
+            results.query_text is not None or \
+            results.query_substring is not None
+        if results.list_songs_by is not None:
+            partial_artist_name = results.list_songs_by
+        elif results.artist_entry_to_erase is not None:
+            partial_artist_name = results.artist_entry_to_erase
+        elif results.coverage_artist is not None:
+            partial_artist_name = results.coverage_artist
+        elif results.query_artist is not None and \
+                (results.query_text is not None or
+                 results.query_substring is not None):
+            partial_artist_name = results.query_artist
+
     logger.debug("Attemping to read artist / song mapping.")
-    mapping_data = read_artist_song_mapping_file()
+    mapping_data = read_artist_song_mapping_file(results.mapping_file,
+                                                 partial_artist_name,
+                                                 read_only)
     if mapping_data != 1:
         logger.debug("We successfully openned retrieved the mapping data!")
     else:
@@ -503,11 +4608,22 @@ if __name__ == "__main__":
         logger.debug("Exiting Now.")
         sys.exit()
 
+    if results.prune_all_switch is True:
+        logger.debug("The user wants to prune every artist's songs.")
+        prune_result = prune_all_artists(mapping_data,
+                                         results.mapping_file)
+        if prune_result != 1:
+            logger.debug("\n Okay it looks like we were successful.")
+        else:
+            logger.debug("\n Okay it looks like we weren't successful.")
+        logger.debug("Ending now!")
+        sys.exit()
+
     if results.artist_to_prune is not None:
         logger.debug("The user wants to prune a specific artist's songs of ")
         logger.debug("stale / annotated songs.")
         prune_result = prune_artist_songs(results.artist_to_prune,
-                                          mapping_data)
+                                          mapping_data, results.mapping_file)
         if prune_result != 1:
             logger.debug("\n Okay it looks like we were successful.")
             logger.debug("Ending now!")
@@ -529,11 +4645,49 @@ if __name__ == "__main__":
             logger.debug("Ending now!")
         sys.exit()
 
+    if results.query_text is not None or \
+            results.query_substring is not None:
+        logger.debug("The user wants to query the songs in our mapping.")
+        for added_date in (results.added_since, results.added_until):
+            if added_date is not None:
+                try:
+                    datetime.date.fromisoformat(added_date)
+                except ValueError:
+                    logger.info(str(added_date) + " isn't a YYYY-MM-DD date.")
+                    sys.exit()
+        query_result = query_songs(
+            mapping_data, results.query_text or None,
+            results.query_substring, results.query_artist,
+            results.min_annotations, results.max_annotations,
+            results.added_since, results.added_until, results.query_sort,
+            results.query_descending, results.query_offset,
+            results.query_limit)
+        if query_result == 1:
+            logger.info("We don't have " + str(results.query_artist) +
+                        " in our mapping. Run --artist first.")
+        else:
+            write_query_results(query_result[0], query_result[1],
+                                results.query_format)
+        logger.debug("Ending now!")
+        sys.exit()
+
+    if results.coverage_artist is not None:
+        logger.debug("The user wants the annotation coverage of: " +
+                     str(results.coverage_artist))
+        coverage_result = annotation_coverage_for_artist(
+            results.coverage_artist, mapping_data, results.mapping_file)
+        if coverage_result == 1:
+            logger.info("We don't have " + str(results.coverage_artist) +
+                        " in our mapping. Run --artist first.")
+        logger.debug("Ending now!")
+        sys.exit()
+
     if results.artist_entry_to_erase is not None:
         logger.debug("Okay it looks like the user wants to erase an artist.")
         erase_artist = results.artist_entry_to_erase
         logger.debug("They want to erase: " + str(erase_artist))
-        erase_result = erase_artist_from_mapping(erase_artist, mapping_data)
+        erase_result = erase_artist_from_mapping(erase_artist, mapping_data,
+                                                 results.mapping_file)
         if erase_result != 1:
             logger.debug("Okay, it looks like we erased them. Ending now!")
             sys.exit()
@@ -542,6 +4696,45 @@ if __name__ == "__main__":
             logger.debug("Ending Now!")
             sys.exit()
 
+    if results.artists_file is not None:
+        logger.debug("The user wants to crawl a batch of artists.")
+        try:
+            artist_names = read_artist_names(results.artists_file)
+        except Exception as e:
+            logger.info("We were unable to read " + str(results.artists_file))
+            logger.debug("The error that occurred is: " + str(e))
+            sys.exit()
+        if results.resolve_ids_switch is True:
+            artist_ids = resolve_artist_ids(artist_names, mapping_data)
+            for artist_name, artist_id in artist_ids.items():
+                if artist_id == 1:
+                    artist_id = "not found"
+                logger.info(str(artist_name) + "\t" + str(artist_id))
+            logger.debug("Ending now!")
+            sys.exit()
+        crawl_artists_batch(artist_names, mapping_data, results.mapping_file,
+                            results.incremental_switch, results.workers)
+        logger.debug("Ending now!")
+        sys.exit()
+
+    if results.alias_to_add is not None:
+        logger.debug("The user wants to add an alias for: " +
+                     str(results.artist))
+        artist_id = search_mapping_for_artist_id(results.artist, mapping_data)
+        alias_result = 1
+        if artist_id != 1:
+            alias_result = register_artist_alias(artist_id,
+                                                 results.alias_to_add,
+                                                 mapping_data,
+                                                 results.mapping_file)
+        if alias_result != 1:
+            logger.info("Added alias " + str(results.alias_to_add) +
+                        " for artist ID " + str(artist_id))
+        else:
+            logger.info("We don't have " + str(results.artist) +
+                        " in our mapping. Run --artist first.")
+        sys.exit()
+
     # Standard get all songs for artist from Genius.com run --artist .
     logger.debug("The user wants to look up artist: " + str(results.artist))
     if mapping_data != 1:
@@ -568,7 +4761,8 @@ if __name__ == "__main__":
             if mapping_data != 1:
                 logger.debug("We are adding it to the mapping")
                 add_result = add_to_artist_mapping(artist_id, results.artist,
-                                                   mapping_data)
+                                                   mapping_data,
+                                                   results.mapping_file)
                 if add_result != 1 and add_result is True:
                     logger.debug("We successfully added researched ID to our ")
                     logger.debug("mapping and have saved the file.")
@@ -577,24 +4771,26 @@ if __name__ == "__main__":
         logger.debug("We are setting artist id to " + str(search_data_result))
         artist_id = search_data_result
 
-    artist_songs = get_artist_songs_genius(artist_id)
-    songs_to_annotate = get_list_of_low_popularity_artist_songs(artist_songs,
-                                                                artist_id)
-
-    logger.debug("Attemping to read artist / song mapping.")
-    mapping_data = read_artist_song_mapping_file()
-    if mapping_data != 1:
-        logger.debug("We successfully retrieved the mapping data!")
-    else:
-        logger.debug("Error occured in read_artist_song_mapping_file()")
-        logger.debug("ERROR: WE CANNOT SAVE SONGS TO MAPPING!")
+    # Songs are merged into the mapping page by page as the crawl goes.
+    crawl_state = mapping_data.get("crawl_state", {}).get(str(artist_id))
+    new_crawl_state = {}
+    songs_added = 0
+    try:
+        for songs_to_annotate in iter_artist_songs_to_annotate(
+                artist_id, crawl_state, results.incremental_switch,
+                new_crawl_state):
+            add_songs_to_mapping_result = add_to_songs_mapping(
+                artist_id, songs_to_annotate, mapping_data,
+                results.mapping_file)
+            songs_added += add_songs_to_mapping_result["added"]
+            logger.debug("We have added " + str(songs_added) +
+                         " songs to our mapping so far.")
+    except (GeniusAPIError, ValueError, KeyError) as e:
+        logger.debug("We were unable to get all of the artist's songs.")
+        logger.debug("The error that occurred is: " + str(e))
         logger.debug("EXITING NOW!")
         sys.exit()
 
-    add_songs_to_mapping_result = add_to_songs_mapping(artist_id,
-                                                       songs_to_annotate,
-                                                       mapping_data)
-    if add_songs_to_mapping_result is True:
-        logger.debug("We successfully added the songs to our mapping.")
-    else:
-        logger.debug("We were unable to add the songs to our mapping.")
+    logger.debug("We successfully added the songs to our mapping.")
+    update_crawl_state(artist_id, new_crawl_state, mapping_data,
+                       results.mapping_file)